@@ -6,11 +6,12 @@ from BlogApp.models import Article
 
 
 class ArticleListView(ListView):
-    template_name = "BlogApp/article_list.html"
+    template_name = "blogapp/article_list.html"
     queryset = Article.objects.filter(pub_date__isnull=False).order_by("-pub_date")
 
 
 class ArticleDetailView(DetailView):
+    template_name = "blogapp/article_detail.html"
     model = Article
 
 
@@ -66,9 +66,8 @@ class RegisterView(CreateView):
 
 class AboutMeView(LoginRequiredMixin, UpdateView):
     def get_object(self, queryset=None):
-        if not Profile.objects.filter(user=self.request.user).exists():
-            Profile.objects.get_or_create(user=self.request.user)
-        return self.request.user.profile
+        profile, created = Profile.objects.get_or_create(user=self.request.user)
+        return profile
 
     model = Profile
     template_name = "myauth/about-me.html"
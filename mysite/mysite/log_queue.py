@@ -0,0 +1,125 @@
+"""
+Логирование через очередь: потоки запросов только кладут записи в неё.
+
+Django вызывает configure() (settings.LOGGING_CONFIG) с settings.LOGGING.
+После обычного dictConfig обработчики корневого логгера переезжают в
+поток QueueListener, а корневой логгер получает DroppingQueueHandler.
+Очередь ограничена settings.LOG_QUEUE_SIZE: когда поток записи отстаёт,
+записи ниже WARNING отбрасываются и подсчитываются, а как только в
+очереди появится место, пишется одно предупреждение с их числом.
+WARNING и выше ждут места в очереди до WARNING_PUT_TIMEOUT секунд.
+"""
+
+import atexit
+import logging
+import logging.config
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+listener: QueueListener | None = None
+
+WARNING_PUT_TIMEOUT = 1.0
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler, который не блокирует вызывающего на полной очереди
+    дольше put_timeout, и то только ради WARNING и выше.
+    """
+
+    def __init__(self, maxsize: int, put_timeout: float = WARNING_PUT_TIMEOUT):
+        super().__init__(queue.Queue(maxsize))
+        self.put_timeout = put_timeout
+        self.dropped = 0
+        self.dropped_lock = threading.Lock()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            # Чтение без блокировки - только подсказка, счётчик забирает
+            # enqueue_summary под блокировкой
+            if self.dropped:
+                self.enqueue_summary()
+            if record.levelno >= logging.WARNING:
+                self.queue.put(self.prepare(record), timeout=self.put_timeout)
+            else:
+                self.enqueue(self.prepare(record))
+        except queue.Full:
+            with self.dropped_lock:
+                self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self.queue.put_nowait(record)
+
+    def enqueue_summary(self) -> None:
+        with self.dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        if not dropped:
+            # Другой поток уже записал сводку
+            return
+        summary = logging.LogRecord(
+            log.name,
+            logging.WARNING,
+            __file__,
+            0,
+            "Log queue was full, dropped %d records",
+            (dropped,),
+            None,
+        )
+        try:
+            self.enqueue(self.prepare(summary))
+        except queue.Full:
+            # Сводку запишем со следующей записью, текущая может дождаться места
+            with self.dropped_lock:
+                self.dropped += dropped
+
+
+def configure(config: dict) -> None:
+    global listener
+    logging.config.dictConfig(config)
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    if not handlers:
+        return
+    stop_listener()
+    handler = DroppingQueueHandler(settings.LOG_QUEUE_SIZE)
+    for target in handlers:
+        root.removeHandler(target)
+    root.addHandler(handler)
+    listener = QueueListener(handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+
+
+def stop_listener() -> None:
+    """
+    Дописывает оставшиеся в очереди записи и останавливает поток.
+    """
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
+def restart_listener_in_child() -> None:
+    # Поток слушателя не переживает fork (gunicorn --preload, пул
+    # процессов), а очередь могла остаться с ожидающим его условием
+    if listener is None:
+        return
+    fresh = queue.Queue(listener.queue.maxsize)
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, DroppingQueueHandler):
+            handler.queue = fresh
+    listener.queue = fresh
+    listener._thread = None
+    listener.start()
+
+
+atexit.register(stop_listener)
+os.register_at_fork(after_in_child=restart_listener_in_child)
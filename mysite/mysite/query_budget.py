@@ -0,0 +1,208 @@
+"""
+Query budget harness: counts SQL queries per URL of the project apps.
+
+Every named route of URLCONFS that handles GET is requested at two data
+sizes. A route fails the budget when it responds with an error, when its
+query count grows with the data (N+1) or when it exceeds the checked-in
+limit from query_budgets.json. Run the check with
+
+    python manage.py test mysite.tests
+
+and refresh the budget file after an intentional change with
+
+    UPDATE_QUERY_BUDGETS=1 python manage.py test mysite.tests
+"""
+
+import json
+from datetime import date, timedelta
+from importlib import import_module
+from pathlib import Path
+from typing import Callable, Iterator
+
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, reverse
+from django.utils import timezone
+
+from BlogApp.models import Article
+from myauth.models import Profile
+from shopapp.models import (
+    DailyProductSales,
+    DailySales,
+    Job,
+    Order,
+    Product,
+    ProductImage,
+)
+
+URLCONFS = ("shopapp.urls", "myauth.urls", "BlogApp.urls", "myapiapp.urls")
+BUDGET_FILE = Path(__file__).with_name("query_budgets.json")
+# Меньше размера страницы API, чтобы N+1 в пределах страницы был заметен
+SMALL_SIZE = 3
+LARGE_SIZE = 1000
+PRODUCTS_PER_ORDER = 3
+
+# Значения параметров маршрута для страниц конкретного объекта
+URL_KWARGS: dict[str, Callable[[dict], dict]] = {
+    "shopapp:product_details": lambda data: {"pk": data["product"].pk},
+    "shopapp:product_update": lambda data: {"pk": data["product"].pk},
+    "shopapp:product_delete": lambda data: {"pk": data["product"].pk},
+    "shopapp:order_delete": lambda data: {"pk": data["order"].pk},
+    "shopapp:order_details": lambda data: {"pk": data["order"].pk},
+    "shopapp:order_update": lambda data: {"pk": data["order"].pk},
+    "shopapp:user-orders": lambda data: {"user_id": data["user"].pk},
+    "shopapp:user-orders-export": lambda data: {"user_id": data["user"].pk},
+    "shopapp:product-detail": lambda data: {"pk": data["product"].pk},
+    "shopapp:order-detail": lambda data: {"pk": data["order"].pk},
+    "shopapp:job-detail": lambda data: {"pk": data["job"].pk},
+    "shopapp:dailysales-detail": lambda data: {"pk": data["daily_sales"].pk},
+    "shopapp:dailyproductsales-detail": lambda data: {
+        "pk": data["daily_product_sales"].pk
+    },
+    "myauth:user-details": lambda data: {"pk": data["user"].pk},
+    "BlogApp:article": lambda data: {"pk": data["article"].pk},
+}
+
+
+def iter_url_patterns(patterns, namespace: str) -> Iterator[tuple[str, set, Callable]]:
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_url_patterns(pattern.url_patterns, namespace)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield (
+                f"{namespace}:{pattern.name}",
+                set(pattern.pattern.regex.groupindex),
+                pattern.callback,
+            )
+
+
+def handles_get(view: Callable) -> bool:
+    # ViewSet роутера знает свои методы в actions, class-based view - в
+    # методах класса; функции считаем отвечающими на GET
+    actions = getattr(view, "actions", None)
+    if actions is not None:
+        return "get" in actions
+    view_class = getattr(view, "view_class", None)
+    return view_class is None or hasattr(view_class, "get")
+
+
+def get_url_names() -> list[str]:
+    """
+    Имена маршрутов, отвечающих на GET, без параметра format (суффиксы
+    формата DRF роутера).
+    """
+    names = {}
+    for urlconf in URLCONFS:
+        module = import_module(urlconf)
+        patterns = iter_url_patterns(module.urlpatterns, module.app_name)
+        for name, kwargs, view in patterns:
+            if "format" not in kwargs and handles_get(view):
+                names.setdefault(name, kwargs)
+    return sorted(names)
+
+
+def seed_dataset(size: int, prefix: str) -> dict:
+    """
+    Создаёт по size пользователей, товаров, заказов, статей, групп и
+    прочих строк и возвращает по одному объекту каждого вида.
+    """
+    users = User.objects.bulk_create(
+        User(username=f"{prefix}-user-{i}") for i in range(size)
+    )
+    Profile.objects.bulk_create(Profile(user=user) for user in users)
+    products = Product.objects.bulk_create(
+        Product(
+            name=f"{prefix} product {i}",
+            description=f"Description {i}",
+            price=i % 100 + 1,
+            discount=i % 30,
+            created_by=users[i % size],
+        )
+        for i in range(size)
+    )
+    ProductImage.objects.bulk_create(
+        ProductImage(product=product, image=f"products/{product.pk}.jpg")
+        for product in products
+    )
+    orders = Order.objects.bulk_create(
+        Order(delivery_address=f"Street {i}", user=users[i % size]) for i in range(size)
+    )
+    Order.products.through.objects.bulk_create(
+        Order.products.through(
+            order_id=order.pk, product_id=products[(i + j) % size].pk
+        )
+        for i, order in enumerate(orders)
+        for j in range(PRODUCTS_PER_ORDER)
+    )
+    Order.objects.filter(pk__in=[order.pk for order in orders]).recompute_totals()
+    Article.objects.bulk_create(
+        Article(title=f"{prefix} article {i}", content="Text", pub_date=timezone.now())
+        for i in range(size)
+    )
+    groups = Group.objects.bulk_create(
+        Group(name=f"{prefix}-group-{i}") for i in range(size)
+    )
+    permissions = list(Permission.objects.all()[:2])
+    for group in groups:
+        group.permissions.set(permissions)
+    jobs = Job.objects.bulk_create(
+        Job(kind="export_products_csv", created_by=users[0]) for _ in range(size)
+    )
+    first_day = DailySales.objects.count()
+    days = DailySales.objects.bulk_create(
+        DailySales(date=date(2000, 1, 1) + timedelta(days=first_day + i))
+        for i in range(size)
+    )
+    product_days = DailyProductSales.objects.bulk_create(
+        DailyProductSales(date=day.date, product=products[i])
+        for i, day in enumerate(days)
+    )
+    return {
+        "user": users[0],
+        "product": products[0],
+        "order": orders[0],
+        "article": Article.objects.filter(title=f"{prefix} article 0").get(),
+        "job": jobs[0],
+        "daily_sales": days[0],
+        "daily_product_sales": product_days[0],
+    }
+
+
+def count_queries(client: Client, url: str) -> tuple[int, int]:
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url, HTTP_ACCEPT="application/json,text/html;q=0.9")
+        if response.streaming:
+            b"".join(response.streaming_content)
+    return response.status_code, len(queries)
+
+
+def measure(client: Client, user: User, data: dict) -> dict[str, tuple[int, int]]:
+    """
+    Возвращает {имя маршрута: (статус, число запросов)}.
+    Перед каждым запросом клиент заново логинится: часть маршрутов
+    (logout) сбрасывает сессию.
+    """
+    results = {}
+    # Считаем запросы без кэша, иначе второй замер попал бы в кэш первого
+    cache.clear()
+    # Ошибка страницы - тоже результат (статус 500), а не падение замера
+    client.raise_request_exception = False
+    for name in get_url_names():
+        kwargs = URL_KWARGS[name](data) if name in URL_KWARGS else {}
+        url = reverse(name, kwargs=kwargs)
+        client.force_login(user)
+        results[name] = count_queries(client, url)
+    return results
+
+
+def load_budgets() -> dict[str, int]:
+    if not BUDGET_FILE.exists():
+        return {}
+    return json.loads(BUDGET_FILE.read_text())
+
+
+def save_budgets(budgets: dict[str, int]) -> None:
+    BUDGET_FILE.write_text(json.dumps(budgets, indent=2, sort_keys=True) + "\n")
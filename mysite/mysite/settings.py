@@ -9,8 +9,8 @@ https://docs.djangoproject.com/en/5.0/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
-import logging.config
 from pathlib import Path
+from tempfile import gettempdir
 from django.utils.translation import gettext_lazy as _
 from os import getenv
 from django.urls import reverse_lazy
@@ -68,12 +68,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "requestdataapp.middlewares.MetricsMiddleware",
     # "django.middleware.cache.UpdateCacheMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "requestdataapp.middlewares.RateLimitMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django.middleware.locale.LocaleMiddleware",
@@ -119,6 +121,19 @@ CACHES = {
         # "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
         # "LOCATION": "/var/tmp/django_cache",
     },
+    # Счётчики лимитов запросов. Лимит общий для воркеров, только если
+    # кэш общий: задайте DJANGO_REDIS_URL (например, redis://redis:6379/0,
+    # см. docker-compose.yaml), incr в Redis атомарный. Без него счётчики
+    # в памяти процесса, это годится только для разработки.
+    "ratelimit": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": getenv("DJANGO_REDIS_URL"),
+    }
+    if getenv("DJANGO_REDIS_URL")
+    else {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "ratelimit",
+    },
 }
 CACHE_MIDDLEWARE_SECONDS = 200
 # Password validation
@@ -187,10 +202,35 @@ SPECTACULAR_SETTINGS = {
     "SERVE_INCLUDE_SCHEMA": False,
 }
 
+CSV_IMPORT_BATCH_SIZE = 1000
+
+# Тесты идут с настоящим кэшем в памяти, см. mysite.test_runner
+TEST_RUNNER = "mysite.test_runner.TestRunner"
+
+# Файлы метрик процессов, см. requestdataapp.metrics. Они нужны, только
+# пока процессы живы, поэтому лежат во временном каталоге, а не в database
+METRICS_DIR = Path(getenv("DJANGO_METRICS_DIR", Path(gettempdir()) / "mysite-metrics"))
+METRICS_FLUSH_INTERVAL = 5
+
+# Лимиты запросов клиента по имени маршрута, см. requestdataapp.ratelimit
+RATELIMIT_ENABLED = True
+RATELIMIT_CACHE = "ratelimit"
+RATELIMIT_LRU_SIZE = 10_000
+RATELIMITS = {
+    "default": "300/m",
+    "shopapp:product-upload-csv": "10/m",
+    "shopapp:product-export-csv": "10/m",
+}
+
 LOGFILE_NAME = BASE_DIR / "log.txt"
 # LOGFILE_SIZE = 400
 LOGFILE_SIZE = 1 * 1024 * 1024
 LOGFILE_COUNT = 3
+LOGLEVEL = getenv("DJANGO_LOGLEVEL", "info").upper()
+
+# Обработчики корневого логгера работают в отдельном потоке, см. mysite.log_queue
+LOGGING_CONFIG = "mysite.log_queue.configure"
+LOG_QUEUE_SIZE = 10_000
 
 LOGGING = {
     "version": 1,
@@ -219,32 +259,7 @@ LOGGING = {
             "console",
             "logfile",
         ],
-        "level": "INFO",
+        "level": LOGLEVEL,
     },
 }
 
-LOGLEVEL =getenv("DJANGO_LOGLEVEL","info").upper()
-logging.config.dictConfig({
-    "version":1,
-    "disable_existing_loggers":False,
-    "formatters":{
-        "console": {
-            "format": "%(asctime)s %(levelname)s [%(name)s:%(lineno)s] %(module)s %(message)s",
-        }
-    },
-    "handlers":{
-        "console": {
-            "class": "logging.StreamHandler",
-            "formatter":"console",
-        },
-    },
-    "loggers": {
-        "": {
-            "level": LOGLEVEL,
-            "handlers": [
-                'console'
-            ],
-        },
-    },
-
-})
\ No newline at end of file
@@ -0,0 +1,36 @@
+"""
+Test runner of the project.
+
+The default cache is a DummyCache, so without this runner the cache
+code paths (versioned keys, cached list responses) would never be
+exercised by the suite. Tests run against an in-memory LocMemCache.
+Request metrics of the test process go to a throwaway METRICS_DIR.
+"""
+
+from tempfile import TemporaryDirectory
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.metrics_dir = TemporaryDirectory()
+        self.test_settings = override_settings(
+            CACHES={
+                **settings.CACHES,
+                "default": {
+                    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                    "LOCATION": "tests",
+                },
+            },
+            METRICS_DIR=self.metrics_dir.name,
+        )
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        self.metrics_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,103 @@
+import logging
+import os
+from threading import Timer
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.utils import translation
+
+from myauth.models import Profile
+from mysite import log_queue
+from mysite.log_queue import DroppingQueueHandler
+from mysite.query_budget import (
+    LARGE_SIZE,
+    SMALL_SIZE,
+    URL_KWARGS,
+    get_url_names,
+    load_budgets,
+    measure,
+    save_budgets,
+    seed_dataset,
+)
+
+
+class QueryBudgetTestCase(TestCase):
+    def setUp(self):
+        self.enterContext(translation.override("en"))
+        self.admin = User.objects.create_superuser("budget-admin", password="admin")
+        Profile.objects.create(user=self.admin)
+
+    def test_url_kwargs_are_known(self):
+        for name in get_url_names():
+            if name.endswith(("-detail", "_details")):
+                self.assertIn(name, URL_KWARGS)
+
+    def test_query_counts(self):
+        data = seed_dataset(SMALL_SIZE, "small")
+        small = measure(self.client, self.admin, data)
+        seed_dataset(LARGE_SIZE - SMALL_SIZE, "large")
+        large = measure(self.client, self.admin, data)
+
+        if os.environ.get("UPDATE_QUERY_BUDGETS"):
+            save_budgets({name: queries for name, (_, queries) in large.items()})
+        budgets = load_budgets()
+        for name, (status, queries) in large.items():
+            with self.subTest(name, status=status):
+                self.assertLess(status, 400, f"{name} responds with an error")
+                self.assertLessEqual(
+                    queries,
+                    small[name][1],
+                    f"{name} runs more queries with more data",
+                )
+                self.assertIn(name, budgets, f"{name} has no query budget")
+                self.assertLessEqual(queries, budgets[name])
+
+
+class LogQueueTestCase(SimpleTestCase):
+    def record(self, message: str) -> logging.LogRecord:
+        return logging.makeLogRecord({"msg": message, "levelno": logging.INFO})
+
+    def drain(self, handler: DroppingQueueHandler) -> list[str]:
+        messages = []
+        while not handler.queue.empty():
+            messages.append(handler.queue.get_nowait().getMessage())
+        return messages
+
+    def test_root_logger_only_enqueues(self):
+        handlers = logging.getLogger().handlers
+        self.assertEqual(
+            [type(handler) for handler in handlers], [DroppingQueueHandler]
+        )
+        self.assertIsNotNone(log_queue.listener)
+
+    def test_full_queue_drops_and_summarizes(self):
+        handler = DroppingQueueHandler(maxsize=2)
+        for i in range(4):
+            handler.emit(self.record(f"message {i}"))
+        self.assertEqual(handler.dropped, 2)
+        self.assertEqual(self.drain(handler), ["message 0", "message 1"])
+        handler.emit(self.record("message 4"))
+        self.assertEqual(
+            self.drain(handler),
+            ["Log queue was full, dropped 2 records", "message 4"],
+        )
+        self.assertEqual(handler.dropped, 0)
+
+    def test_warnings_wait_for_room(self):
+        handler = DroppingQueueHandler(maxsize=1, put_timeout=0.01)
+        handler.emit(self.record("info"))
+        warning = self.record("warning")
+        warning.levelno = logging.WARNING
+        handler.emit(warning)
+        self.assertEqual(handler.dropped, 1)
+        handler.put_timeout = 5
+        Timer(0.05, handler.queue.get).start()
+        handler.emit(warning)
+        self.assertEqual(handler.dropped, 1)
+        self.assertEqual(self.drain(handler), ["warning"])
+
+    def test_summary_already_taken_is_not_repeated(self):
+        handler = DroppingQueueHandler(maxsize=2)
+        # Другой поток забрал счётчик между проверкой в emit и блокировкой
+        handler.enqueue_summary()
+        self.assertEqual(self.drain(handler), [])
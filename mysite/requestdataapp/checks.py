@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_ratelimit_cache(app_configs, **kwargs):
+    """
+    Счётчики в памяти процесса не общие для воркеров gunicorn: каждый
+    воркер пропускал бы клиенту свой лимит.
+    """
+    if not settings.RATELIMIT_ENABLED:
+        return []
+    if isinstance(caches[settings.RATELIMIT_CACHE], LocMemCache):
+        return [
+            Warning(
+                "Rate limit counters are kept in process memory, "
+                "so every worker applies its own limit.",
+                hint="Set DJANGO_REDIS_URL to share them between workers.",
+                id="requestdataapp.W001",
+            )
+        ]
+    return []
@@ -0,0 +1,245 @@
+"""
+Метрики запросов в формате Prometheus, общие для всех процессов.
+
+Каждый процесс копит счётчики и гистограммы в памяти и раз в
+METRICS_FLUSH_INTERVAL секунд атомарно переписывает свой файл
+METRICS_DIR/<pid>.json. Эндпоинт /metrics/ складывает файлы всех
+процессов, так что gunicorn воркеры видны вместе. Файлы завершившихся
+процессов при этом удаляются: их счётчики пропадают из суммы, и
+Prometheus видит это как сброс счётчика.
+"""
+
+import atexit
+import json
+import os
+import threading
+from bisect import bisect_left
+from pathlib import Path
+from time import monotonic
+
+from django.conf import settings
+
+# Границы гистограмм, как у prometheus_client по умолчанию
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+METRICS = {
+    "django_http_requests_total": ("counter", "Requests by view, method and status"),
+    "django_http_exceptions_total": ("counter", "Unhandled exceptions by view"),
+    "django_http_request_duration_seconds": (
+        "histogram",
+        "Request latency by view and status",
+    ),
+    "django_db_queries_per_request": ("histogram", "SQL queries per request by view"),
+    "django_db_query_duration_seconds_total": (
+        "counter",
+        "Time spent in SQL queries by view",
+    ),
+}
+BUCKETS = {
+    "django_http_request_duration_seconds": LATENCY_BUCKETS,
+    "django_db_queries_per_request": QUERY_COUNT_BUCKETS,
+}
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class MetricsStore:
+    """
+    Метрики одного процесса. Счётчики - {(имя, метки): значение},
+    гистограммы - {(имя, метки): [число по корзинам..., больше последней
+    границы, сумма, количество]}.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.pid = os.getpid()
+            self.counters: dict[tuple[str, Labels], float] = {}
+            self.histograms: dict[tuple[str, Labels], list] = {}
+            self.flushed_at = monotonic()
+
+    @property
+    def directory(self) -> Path:
+        return Path(settings.METRICS_DIR)
+
+    def check_fork(self) -> None:
+        # После fork у воркера свои метрики и свой файл
+        if os.getpid() != self.pid:
+            self.reset()
+
+    def inc(self, name: str, labels: Labels, value: float = 1) -> None:
+        key = name, labels
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        buckets = BUCKETS[name]
+        key = name, labels
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = [0] * (len(buckets) + 3)
+        histogram[bisect_left(buckets, value)] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+    def observe_request(
+        self,
+        view: str,
+        method: str,
+        status: int,
+        duration: float,
+        queries: int,
+        query_time: float,
+    ) -> None:
+        self.check_fork()
+        # Метки собираем сразу отсортированными по имени
+        view_label = ("view", view)
+        status_label = ("status", str(status))
+        with self.lock:
+            self.inc(
+                "django_http_requests_total",
+                (("method", method), status_label, view_label),
+            )
+            self.observe(
+                "django_http_request_duration_seconds",
+                (status_label, view_label),
+                duration,
+            )
+            self.observe("django_db_queries_per_request", (view_label,), queries)
+            self.inc(
+                "django_db_query_duration_seconds_total", (view_label,), query_time
+            )
+        self.flush()
+
+    def observe_exception(self, view: str, exception: Exception) -> None:
+        self.check_fork()
+        with self.lock:
+            self.inc(
+                "django_http_exceptions_total",
+                (("exception", type(exception).__name__), ("view", view)),
+            )
+
+    def dump(self) -> dict:
+        with self.lock:
+            return {
+                "counters": [
+                    [name, labels, value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                "histograms": [
+                    [name, labels, values]
+                    for (name, labels), values in self.histograms.items()
+                ],
+            }
+
+    def flush(self, force: bool = False) -> None:
+        if (
+            not force
+            and monotonic() - self.flushed_at < settings.METRICS_FLUSH_INTERVAL
+        ):
+            return
+        self.flushed_at = monotonic()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{os.getpid()}.json"
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps(self.dump()))
+        os.replace(tmp_path, path)
+
+    def collect(self) -> dict:
+        """
+        Складывает файлы всех процессов, свои метрики сбрасываются заранее.
+        """
+        self.flush(force=True)
+        counters: dict[tuple[str, Labels], float] = {}
+        histograms: dict[tuple[str, Labels], list] = {}
+        for path in self.directory.glob("*.json"):
+            if not is_alive(path.stem):
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                data = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            for name, label_pairs, value in data["counters"]:
+                key = name, tuple(map(tuple, label_pairs))
+                counters[key] = counters.get(key, 0) + value
+            for name, label_pairs, values in data["histograms"]:
+                key = name, tuple(map(tuple, label_pairs))
+                total = histograms.setdefault(key, [0] * len(values))
+                for i, value in enumerate(values):
+                    total[i] += value
+        return {"counters": counters, "histograms": histograms}
+
+
+def is_alive(pid: str) -> bool:
+    try:
+        os.kill(int(pid), 0)
+    except ValueError:
+        # Не файл процесса, не трогаем
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Процесс есть, но принадлежит другому пользователю
+        return True
+    return True
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{escape(value)}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+
+def format_number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(collected: dict) -> str:
+    """
+    Текстовый формат экспозиции Prometheus 0.0.4.
+    """
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (metric, labels), value in sorted(collected["counters"].items()):
+                if metric == name:
+                    lines.append(
+                        f"{name}{format_labels(labels)} {format_number(value)}"
+                    )
+            continue
+        for (metric, labels), values in sorted(collected["histograms"].items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            bounds = [*map(str, BUCKETS[name]), "+Inf"]
+            for bound, count in zip(bounds, values[:-2]):
+                cumulative += count
+                bucket_labels = (*labels, ("le", bound))
+                lines.append(
+                    f"{name}_bucket{format_labels(bucket_labels)} {cumulative}"
+                )
+            lines.append(
+                f"{name}_sum{format_labels(labels)} {format_number(values[-2])}"
+            )
+            lines.append(f"{name}_count{format_labels(labels)} {values[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+metrics = MetricsStore()
+
+
+@atexit.register
+def flush_at_exit() -> None:
+    if metrics.counters:
+        metrics.flush(force=True)
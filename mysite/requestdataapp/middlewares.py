@@ -1,53 +1,109 @@
+import logging
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
 from django.http import HttpRequest, HttpResponse
-import time
 from datetime import timedelta
 
+from .metrics import metrics
+from .ratelimit import client_id, get_rate, hit
+
+log = logging.getLogger(__name__)
+
+
 def set_useragent_on_request_middleware(get_response):
 
-    print('Initial call')
+    log.debug("User agent middleware initialized")
 
     def middleware(request: HttpRequest):
-        print('before get response')
+        log.debug("Before get response")
         request.user_agent = request.META['HTTP_USER_AGENT']
         response = get_response(request)
-        print('after getresponse')
+        log.debug("After get response")
         return response
     return middleware
 
 
-class CountRequestsMiddleware:
+class MetricsMiddleware:
+    """
+    Считает запросы, исключения, время ответа и SQL запросы по имени
+    маршрута и статусу, см. requestdataapp.metrics. Для потоковых ответов
+    время - до начала отдачи тела.
+    """
+
     def __init__(self, get_response):
         self.get_response = get_response
-        self.requests_count = 0
-        self.responses_count = 0
-        self.exceptions_count = 0
 
     def __call__(self, request: HttpRequest):
-        self.requests_count += 1
-        print('requests count', self.requests_count)
-        response = self.get_response(request)
-        self.responses_count += 1
-        print('responses count', self.responses_count)
+        counter = QueryCounter()
+        start = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        metrics.observe_request(
+            view=view_name(request),
+            method=request.method,
+            status=response.status_code,
+            duration=perf_counter() - start,
+            queries=counter.count,
+            query_time=counter.duration,
+        )
         return response
 
-    def process_exception(self,request:HttpRequest, exception: Exception):
-        self.exceptions_count += 1
-        print('got', self.exceptions_count, 'exceptions so far')
+    def process_exception(self, request: HttpRequest, exception: Exception):
+        metrics.observe_exception(view_name(request), exception)
+
+
+def view_name(request: HttpRequest) -> str:
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "<unresolved>"
+    return match.view_name
 
 
-class ThrottlingMiddleware:
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += perf_counter() - start
+
+
+class RateLimitMiddleware:
+    """
+    Ограничивает частоту запросов клиента к маршруту по лимитам из
+    settings.RATELIMITS, см. requestdataapp.ratelimit. При превышении
+    отвечает 429 с заголовком Retry-After.
+    """
+
     def __init__(self, get_response):
         self.get_response = get_response
-        self.time = None
-        self.ip_address = None
 
     def __call__(self, request: HttpRequest):
-        time_of_req = time.time()
-        new_address = request.META['REMOTE_ADDR']
-        if new_address == self.ip_address and (time_of_req - self.time) < 5:
-            return HttpResponse('<h2>Превышено количество запросов,попробуйте зайти позже</h2>')
-        else:
-            self.ip_address = new_address
-            self.time = time_of_req
-            response = self.get_response(request)
-            return response
+        return self.get_response(request)
+
+    def process_view(self, request: HttpRequest, view_func, view_args, view_kwargs):
+        if not settings.RATELIMIT_ENABLED:
+            return None
+        route = request.resolver_match.view_name
+        rate = get_rate(route)
+        if rate is None:
+            return None
+        retry_after = hit(route, client_id(request), rate)
+        if retry_after is None:
+            return None
+        response = HttpResponse(
+            "<h2>Превышено количество запросов, попробуйте зайти позже</h2>",
+            status=429,
+        )
+        response["Retry-After"] = str(retry_after)
+        return response
@@ -0,0 +1,134 @@
+"""
+Ограничение частоты запросов клиента к маршруту.
+
+Скользящее окно из двух соседних фиксированных окон: счётчик текущего
+окна атомарно увеличивается в кэше RATELIMIT_CACHE (cache.add + incr),
+счётчик прошлого окна учитывается с весом ещё не прошедшей его доли.
+Чтобы лимит был общим для воркеров, кэш должен быть общим: Redis по
+адресу из DJANGO_REDIS_URL, где incr атомарный. Клиенты, уже получившие
+отказ, запоминаются в LRU процесса до конца блокировки, и их повторные
+запросы в кэш не ходят.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from time import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpRequest
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+@dataclass(frozen=True)
+class Rate:
+    limit: int
+    period: int
+
+
+@lru_cache
+def parse_rate(rate: str) -> Rate:
+    """
+    "10/m" - 10 запросов в минуту, как в DRF: s, m, h, d.
+    """
+    count, _, period = rate.partition("/")
+    return Rate(int(count), PERIODS[period[0]])
+
+
+def get_rate(route: str) -> Rate | None:
+    """
+    Лимит маршрута из settings.RATELIMITS, иначе "default".
+    None - маршрут не ограничен.
+    """
+    rates = settings.RATELIMITS
+    rate = rates[route] if route in rates else rates.get("default")
+    return parse_rate(rate) if rate else None
+
+
+def client_id(request: HttpRequest) -> str:
+    # По адресу, а не по пользователю: request.user стоил бы двух
+    # запросов к базе (сессия и пользователь) на каждый запрос
+    return request.META.get("REMOTE_ADDR", "")
+
+
+class BlockedClients:
+    """
+    LRU заблокированных ключей: ключ -> время окончания блокировки.
+    Размер ограничен settings.RATELIMIT_LRU_SIZE.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.until: OrderedDict[str, float] = OrderedDict()
+
+    def retry_after(self, key: str, now: float) -> int | None:
+        with self.lock:
+            until = self.until.get(key)
+            if until is None:
+                return None
+            if until <= now:
+                del self.until[key]
+                return None
+            self.until.move_to_end(key)
+            return math.ceil(until - now)
+
+    def add(self, key: str, until: float) -> None:
+        with self.lock:
+            self.until[key] = until
+            self.until.move_to_end(key)
+            while len(self.until) > settings.RATELIMIT_LRU_SIZE:
+                self.until.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.until.clear()
+
+
+blocked_clients = BlockedClients()
+
+
+def retry_after(rate: Rate, previous: int, current: int, elapsed: float) -> int:
+    """
+    Через сколько секунд оценка окна опустится ниже лимита, если клиент
+    не будет слать запросы. elapsed - прошедшая доля текущего окна.
+    """
+    room = rate.limit - 1 - current
+    if room >= 0 and previous:
+        # Хватит того, что вес прошлого окна ещё уменьшится
+        wait = 1 - room / previous - elapsed
+    else:
+        # Ждём следующего окна, пока текущее не станет прошлым с малым весом
+        wait = 1 - elapsed + max(0.0, 1 - (rate.limit - 1) / current)
+    return max(1, math.ceil(wait * rate.period))
+
+
+def hit(route: str, client: str, rate: Rate, now: float | None = None) -> int | None:
+    """
+    Учитывает запрос клиента к маршруту. Возвращает None, если запрос
+    в пределах лимита, иначе через сколько секунд можно повторить.
+    """
+    now = time() if now is None else now
+    key = f"{route}:{client}"
+    blocked = blocked_clients.retry_after(key, now)
+    if blocked is not None:
+        return blocked
+    cache = caches[settings.RATELIMIT_CACHE]
+    window, elapsed = divmod(now / rate.period, 1)
+    current_key = f"ratelimit:{key}:{int(window)}"
+    cache.add(current_key, 0, timeout=rate.period * 2)
+    try:
+        current = cache.incr(current_key)
+    except ValueError:
+        # Ключ вытеснили между add и incr (или кэш не хранит значений)
+        cache.set(current_key, 1, timeout=rate.period * 2)
+        current = 1
+    previous = cache.get(f"ratelimit:{key}:{int(window) - 1}", 0)
+    if previous * (1 - elapsed) + current <= rate.limit:
+        return None
+    wait = retry_after(rate, previous, current, elapsed)
+    blocked_clients.add(key, now + wait)
+    return wait
@@ -1,3 +1,173 @@
-from django.test import TestCase
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from requestdataapp.checks import check_ratelimit_cache
+from requestdataapp.metrics import metrics
+from requestdataapp.middlewares import MetricsMiddleware
+from requestdataapp.ratelimit import Rate, blocked_clients, hit
+
+
+class MetricsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username="staff", is_staff=True)
+
+    def setUp(self):
+        self.directory = self.enterContext(TemporaryDirectory())
+        self.enterContext(override_settings(METRICS_DIR=self.directory))
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def scrape(self) -> str:
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        return response.content.decode()
+
+    def test_requests_latency_and_queries(self):
+        self.client.get(reverse("requestdataapp:get-view"), {"a": "1"})
+        self.client.get(reverse("requestdataapp:get-view"))
+        text = self.scrape()
+        self.assertIn(
+            'django_http_requests_total{method="GET",status="200",'
+            'view="requestdataapp:get-view"} 2',
+            text,
+        )
+        self.assertIn(
+            "django_http_request_duration_seconds_bucket"
+            '{status="200",view="requestdataapp:get-view",le="+Inf"} 2',
+            text,
+        )
+        self.assertIn(
+            'django_db_queries_per_request_bucket{view="requestdataapp:get-view",'
+            'le="0"} 2',
+            text,
+        )
+
+    def test_counts_sql_queries(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse("metrics"))
+        text = self.scrape()
+        # Сессия и пользователь - два запроса к базе
+        self.assertIn(
+            'django_db_queries_per_request_bucket{view="metrics",le="2"} 1', text
+        )
+
+    def test_sums_files_of_all_processes(self):
+        self.client.get(reverse("requestdataapp:get-view"))
+        other = {
+            "counters": [
+                [
+                    "django_http_requests_total",
+                    [
+                        ["method", "GET"],
+                        ["status", "200"],
+                        ["view", "requestdataapp:get-view"],
+                    ],
+                    5,
+                ]
+            ],
+            "histograms": [],
+        }
+        with open(f"{self.directory}/{os.getppid()}.json", "w") as file:
+            json.dump(other, file)
+        self.assertIn(
+            'django_http_requests_total{method="GET",status="200",'
+            'view="requestdataapp:get-view"} 6',
+            self.scrape(),
+        )
+
+    def test_files_of_exited_processes_are_removed(self):
+        process = subprocess.run(
+            [sys.executable, "-c", "import os; print(os.getpid())"],
+            capture_output=True,
+            text=True,
+        )
+        dead = Path(self.directory, f"{process.stdout.strip()}.json")
+        dead.write_text(
+            json.dumps(
+                {
+                    "counters": [
+                        [
+                            "django_http_requests_total",
+                            [["method", "GET"], ["status", "200"], ["view", "dead"]],
+                            1,
+                        ]
+                    ],
+                    "histograms": [],
+                }
+            )
+        )
+        self.assertNotIn('view="dead"', self.scrape())
+        self.assertFalse(dead.exists())
+        self.assertTrue(Path(self.directory, f"{os.getpid()}.json").exists())
+
+    def test_exceptions_are_counted(self):
+        request = RequestFactory().get("/")
+        MetricsMiddleware(lambda request: None).process_exception(
+            request, ValueError("boom")
+        )
+        self.assertIn(
+            'django_http_exceptions_total{exception="ValueError",'
+            'view="<unresolved>"} 1',
+            self.scrape(),
+        )
+
+    def test_metrics_are_staff_only(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+        user = User.objects.create_user(username="user")
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+
+
+@override_settings(RATELIMITS={"default": None, "requestdataapp:get-view": "2/m"})
+class RateLimitTestCase(TestCase):
+    def setUp(self):
+        self.clear()
+        self.addCleanup(self.clear)
+
+    def clear(self):
+        caches["ratelimit"].clear()
+        blocked_clients.clear()
+
+    def test_sliding_window(self):
+        rate = Rate(limit=10, period=60)
+        for _ in range(10):
+            self.assertIsNone(hit("route", "a", rate, now=120))
+        self.assertEqual(hit("route", "a", rate, now=120), 71)
+        self.assertIsNone(hit("route", "b", rate, now=120))
+        self.assertIsNone(hit("other", "a", rate, now=120))
+        # Отказ до конца блокировки отдаётся из LRU, без кэша
+        caches["ratelimit"].clear()
+        self.assertEqual(hit("route", "a", rate, now=150), 41)
+        self.assertIsNone(hit("route", "a", rate, now=200))
+
+    def test_responds_429_with_retry_after(self):
+        url = reverse("requestdataapp:get-view")
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+        other = self.client.get(url, REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(other.status_code, 200)
+        with self.settings(RATELIMIT_ENABLED=False):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_deploy_check_warns_about_process_local_counters(self):
+        self.assertEqual(
+            [warning.id for warning in check_ratelimit_cache(None)],
+            ["requestdataapp.W001"],
+        )
+        with self.settings(RATELIMIT_ENABLED=False):
+            self.assertEqual(check_ratelimit_cache(None), [])
@@ -1,7 +1,13 @@
+import logging
+
 from django.core.files.storage import FileSystemStorage
-from django.http import HttpRequest, HttpResponse
+from django.http import HttpRequest, HttpResponse, HttpResponseForbidden
 from django.shortcuts import render
 
+from .metrics import metrics, render as render_metrics
+
+log = logging.getLogger(__name__)
+
 
 def process_get_view(request: HttpRequest) -> HttpResponse:
     a = request.GET.get('a', '')
@@ -25,9 +31,16 @@ def handle_file_upload(request: HttpRequest) -> HttpResponse:
         fs = FileSystemStorage()
         if request.FILES['myfile'].size < 1e+6:
             filename = fs.save(myfile.name, myfile)
-            print('saved file', filename)
+            log.info("Saved uploaded file %s", filename)
         else:
             return HttpResponse('<h2>Слишком большой размер файла</h2>')
     return render(request, 'requestdataapp/file-upload.html')
 
 
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render_metrics(metrics.collect()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
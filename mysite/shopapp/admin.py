@@ -1,16 +1,16 @@
+from django.conf import settings
 from django.contrib import admin
 from django.db.models import QuerySet
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render, redirect
 from django.urls import path
 
-from .common import save_csv_products
-from .models import Product, Order, ProductImage
+from .jobs import enqueue_job
+from .models import Product, Order, ProductImage, Job
+from .pagination import EstimatedCountPaginator
+from .search import ProductSearchAdminMixin
 from .admin_mixins import ExportAsCSVMixin
-from .forms import CSVImportForm
-from io import TextIOWrapper
-from csv import DictReader
-from .common import save_csv_products
+from .forms import CSVImportForm, ProductCSVImportForm
 
 
 class OrderInline(admin.TabularInline):
@@ -41,7 +41,7 @@ class ProductInline(admin.StackedInline):
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
+class ProductAdmin(ProductSearchAdminMixin, admin.ModelAdmin, ExportAsCSVMixin):
     change_list_template = "shopapp/products_changelist.html"
     actions = [
         mark_archived,
@@ -55,13 +55,15 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
     # list_display = "pk", "name", "description", "price", "discount"
     list_display = "pk", "name", "description_short", "price", "discount", "archived"
     list_display_links = "pk", "name"
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     ordering = "-name", "pk"
     search_fields = "name", "description"
     fieldsets = [
         (
             None,
             {
-                "fields": ("name", "description"),
+                "fields": ("name", "sku", "description"),
             },
         ),
         (
@@ -92,18 +94,32 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
             return obj.description
         return obj.description[:48] + "..."
 
+    def save_related(self, request, form, formsets, change):
+        # Inline заказов меняет промежуточную таблицу без m2m_changed,
+        # пересчитываем и заказы, из которых товар убрали
+        product = form.instance
+        order_ids = set(product.orders.values_list("pk", flat=True))
+        super().save_related(request, form, formsets, change)
+        order_ids.update(product.orders.values_list("pk", flat=True))
+        Order.objects.filter(pk__in=order_ids).recompute_totals()
+
     def import_csv(self, request: HttpRequest) -> HttpResponse:
         if request.method == "GET":
-            form = CSVImportForm()
+            form = ProductCSVImportForm()
             context = {"form": form}
             return render(request, "admin/csv_form.html", context)
-        form = CSVImportForm(request.POST, request.FILES)
+        form = ProductCSVImportForm(request.POST, request.FILES)
         if not form.is_valid():
             context = {"form": form}
             return render(request, "admin/csv_form.html", context, status=400)
-        save_csv_products(
-            file=form.files["csv_file"].file,
-            encoding=request.encoding,
+        job = enqueue_job(
+            "import_products_csv",
+            user=request.user,
+            payload={
+                "encoding": request.encoding or settings.DEFAULT_CHARSET,
+                "upsert": form.cleaned_data["upsert"],
+            },
+            file=form.files["csv_file"],
         )
         # csv_file = TextIOWrapper(
         #     form.files["csv_file"].file,
@@ -112,7 +128,7 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
         # reader = DictReader(csv_file)
         # products = [Product(**row) for row in reader]
         # Product.objects.bulk_create(products)
-        self.message_user(request, "Data from CSV was imported")
+        self.message_user(request, f"CSV import queued as job #{job.pk}")
         return redirect("..")
 
     def get_urls(self):
@@ -132,10 +148,25 @@ class OrderAdmin(admin.ModelAdmin):
     inlines = [
         ProductInline,
     ]
-    list_display = "delivery_address", "promocode", "created_at", "user_verbose"
+    list_display = (
+        "delivery_address",
+        "promocode",
+        "created_at",
+        "user_verbose",
+        "products_count",
+        "total_amount",
+    )
+    readonly_fields = "products_count", "total_amount"
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def get_queryset(self, request):
-        return Order.objects.select_related("user").prefetch_related("products")
+        return Order.objects.select_related("user")
+
+    def save_related(self, request, form, formsets, change):
+        # Inline сохраняет строки промежуточной таблицы без m2m_changed
+        super().save_related(request, form, formsets, change)
+        Order.objects.filter(pk=form.instance.pk).recompute_totals()
 
     def user_verbose(self, obj: Order) -> str:
         return obj.user.first_name or obj.user.username
@@ -150,14 +181,13 @@ class OrderAdmin(admin.ModelAdmin):
             context = {"form": form}
             return render(request, "admin/csv_form.html", context, status=400)
 
-        csv_file = TextIOWrapper(
-            form.files["csv_file"].file,
-            encoding=request.encoding,
+        job = enqueue_job(
+            "import_orders_csv",
+            user=request.user,
+            payload={"encoding": request.encoding or settings.DEFAULT_CHARSET},
+            file=form.files["csv_file"],
         )
-        reader = DictReader(csv_file)
-        orders = [Order(**row) for row in reader]
-        Order.objects.bulk_create(orders)
-        self.message_user(request, "Data from CSV was imported")
+        self.message_user(request, f"CSV import queued as job #{job.pk}")
         return redirect("..")
 
     def get_urls(self):
@@ -166,3 +196,10 @@ class OrderAdmin(admin.ModelAdmin):
             path("import-orders-csv/", self.import_csv, name="import_orders_csv")
         ]
         return new_urls + urls
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = "pk", "kind", "status", "progress", "created_by", "created_at"
+    list_filter = "status", "kind"
+    readonly_fields = "started_at", "finished_at"
@@ -0,0 +1,183 @@
+"""
+Аналитика каталога и продаж на NumPy.
+
+Столбцы читаются из базы кусками по pk (values_list без создания моделей)
+и раскладываются в плотные массивы, индексированные pk: цена и скидка
+товара, владелец заказа. Строки заказов обрабатываются кусками и сразу
+сворачиваются через bincount, поэтому память зависит от максимальных pk,
+а не от числа строк заказов.
+
+Выручка считается по текущей цене товара, как и Order.total_amount.
+"""
+
+from itertools import chain
+from typing import Iterator
+
+import numpy as np
+from django.db.models import FloatField, Max, QuerySet
+from django.db.models.functions import Cast
+
+from .models import Order, Product
+
+CHUNK_SIZE = 500_000
+PERCENTILES = (50, 90, 95, 99)
+DISCOUNT_BANDS = (0, 1, 10, 20, 30, 50, 101)
+DISCOUNT_BAND_LABELS = ("0", "1-9", "10-19", "20-29", "30-49", "50+")
+
+
+def iter_column_chunks(
+    queryset: QuerySet, fields: tuple, dtype, chunk_size: int = CHUNK_SIZE
+) -> Iterator[np.ndarray]:
+    """
+    Отдаёт массивы формы (n, 1 + len(fields)): pk и поля, по chunk_size строк.
+    """
+    queryset = queryset.order_by("pk")
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(chunk.values_list("pk", *fields)[:chunk_size])
+        if not rows:
+            return
+        last_pk = rows[-1][0]
+        width = len(fields) + 1
+        values = np.fromiter(
+            chain.from_iterable(rows), dtype=dtype, count=len(rows) * width
+        )
+        yield values.reshape(len(rows), width)
+
+
+def last_pk(queryset: QuerySet) -> int:
+    return queryset.aggregate(last=Max("pk"))["last"] or 0
+
+
+def dense_column(
+    queryset: QuerySet,
+    field,
+    dtype,
+    fill=0,
+    chunk_size: int = CHUNK_SIZE,
+    size: int | None = None,
+) -> np.ndarray:
+    """
+    Массив значения field, где индекс - pk. Для отсутствующих pk - fill.
+    Если size задан, queryset не должен содержать pk >= size.
+    """
+    if size is None:
+        size = last_pk(queryset) + 1
+    column = np.full(size, fill, dtype=dtype)
+    for chunk in iter_column_chunks(queryset, (field,), dtype, chunk_size):
+        column[chunk[:, 0].astype(np.int64)] = chunk[:, 1]
+    return column
+
+
+def percentiles(values: np.ndarray) -> dict:
+    if not len(values):
+        return {}
+    result = np.percentile(values, PERCENTILES)
+    return {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, result)}
+
+
+def summary(values: np.ndarray) -> dict:
+    return {
+        "count": int(len(values)),
+        "total": round(float(values.sum()), 2),
+        "mean": round(float(values.mean()), 2) if len(values) else None,
+        **percentiles(values),
+    }
+
+
+def price_elasticity(prices: np.ndarray, units: np.ndarray) -> dict:
+    """
+    Наклон log(продажи) от log(цены) по товарам с продажами: насколько
+    в процентах меняются продажи при изменении цены на 1%.
+    """
+    sold = (units > 0) & (prices > 0)
+    result = {"products": int(sold.sum()), "log_log_slope": None}
+    if np.unique(prices[sold]).size > 1:
+        slope, _ = np.polyfit(np.log(prices[sold]), np.log(units[sold]), 1)
+        result["log_log_slope"] = round(float(slope), 4)
+    return result
+
+
+def shop_analytics(chunk_size: int = CHUNK_SIZE) -> dict:
+    # Границы pk фиксируем заранее: строки, добавленные во время расчёта,
+    # не должны выйти за размеры массивов
+    last_product = last_pk(Product.objects.all())
+    last_order = last_pk(Order.objects.all())
+    products = Product.objects.filter(pk__lte=last_product)
+    price = Cast("price", FloatField())
+    prices = dense_column(
+        products, price, np.float64, np.nan, chunk_size, last_product + 1
+    )
+    discounts = dense_column(
+        products, "discount", np.int64, 0, chunk_size, last_product + 1
+    )
+    owners = dense_column(
+        Order.objects.filter(pk__lte=last_order),
+        "user_id",
+        np.int64,
+        -1,
+        chunk_size,
+        last_order + 1,
+    )
+
+    order_revenue = np.zeros(len(owners))
+    units = np.zeros(len(prices), dtype=np.int64)
+    lines = Order.products.through.objects.filter(
+        order_id__lte=last_order, product_id__lte=last_product
+    )
+    lines_count = 0
+    for chunk in iter_column_chunks(
+        lines, ("order_id", "product_id"), np.int64, chunk_size
+    ):
+        order_ids, product_ids = chunk[:, 1], chunk[:, 2]
+        order_revenue += np.bincount(
+            order_ids,
+            weights=np.nan_to_num(prices[product_ids]),
+            minlength=len(order_revenue),
+        )
+        units += np.bincount(product_ids, minlength=len(units))
+        lines_count += len(chunk)
+
+    orders = owners >= 0
+    order_owners = owners[orders]
+    user_spend = np.bincount(order_owners, weights=order_revenue[orders])
+    user_spend = user_spend[np.unique(order_owners)]
+
+    catalog = ~np.isnan(prices)
+    band = np.digitize(np.clip(discounts[catalog], 0, 100), DISCOUNT_BANDS) - 1
+    band_products = np.bincount(band, minlength=len(DISCOUNT_BAND_LABELS))
+    band_units = np.bincount(
+        band, weights=units[catalog], minlength=len(DISCOUNT_BAND_LABELS)
+    )
+    band_revenue = np.bincount(
+        band,
+        weights=units[catalog] * prices[catalog],
+        minlength=len(DISCOUNT_BAND_LABELS),
+    )
+    discount_bands = [
+        {
+            "band": label,
+            "products": int(band_products[i]),
+            "units": int(band_units[i]),
+            "revenue": round(float(band_revenue[i]), 2),
+        }
+        for i, label in enumerate(DISCOUNT_BAND_LABELS)
+    ]
+
+    top = np.sort(user_spend)[::-1][: max(1, len(user_spend) // 10)]
+    return {
+        "order_lines": lines_count,
+        "order_revenue": summary(order_revenue[orders]),
+        "user_spend": {
+            **summary(user_spend),
+            "top_10_percent_share": (
+                round(float(top.sum() / user_spend.sum()), 4)
+                if user_spend.sum()
+                else None
+            ),
+        },
+        "product_prices": summary(prices[catalog]),
+        "discount_bands": discount_bands,
+        "price_elasticity": price_elasticity(prices[catalog], units[catalog]),
+    }
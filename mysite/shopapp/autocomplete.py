@@ -0,0 +1,160 @@
+"""
+Индекс для автодополнения названий товаров.
+
+Индекс живёт в памяти процесса: отсортированный список ключей
+"<нормализованное название>\\x00<pk>" и словарь pk -> название. Поиск
+по префиксу - bisect и просмотр не более limit соседних ключей.
+
+Сохранение и удаление товара в этом процессе обновляют индекс сразу после
+коммита (см. shopapp.signals). Изменения из других процессов и массовые
+update/bulk_create сигналов не посылают, поэтому фоновый поток процесса
+раз в INDEX_REFRESH_INTERVAL строит индекс заново и подменяет старый под
+блокировкой. Поток запускается первым поиском, который ждёт только
+первого построения; запросы индекс не перестраивают.
+"""
+
+import logging
+import sys
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from threading import Event, RLock, Thread
+
+from django.db import connection
+
+from .models import Product
+
+log = logging.getLogger(__name__)
+
+INDEX_REFRESH_INTERVAL = 60 * 5
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+
+def normalize(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+class ProductNameIndex:
+    def __init__(self):
+        self.lock = RLock()
+        self.keys: list[str] = []
+        self.names: dict[int, str] = {}
+        self.built_at: float | None = None
+        self.built = Event()
+        self.thread: Thread | None = None
+        # pk -> товар (None - удалён), изменённые во время построения
+        self.changes: dict[int, Product | None] | None = None
+
+    @staticmethod
+    def make_key(name: str, pk: int) -> str:
+        return f"{normalize(name)}\x00{pk}"
+
+    def build(self) -> None:
+        with self.lock:
+            self.changes = {}
+        try:
+            rows = (
+                Product.objects.filter(archived=False)
+                .values_list("pk", "name")
+                .iterator(chunk_size=5000)
+            )
+            names = dict(rows)
+            keys = sorted(self.make_key(name, pk) for pk, name in names.items())
+        except BaseException:
+            with self.lock:
+                self.changes = None
+            raise
+        with self.lock:
+            changes, self.changes = self.changes, None
+            self.keys, self.names = keys, names
+            self.built_at = time.monotonic()
+            # Изменения, закоммиченные во время чтения, могли в него не попасть
+            for pk, product in changes.items():
+                if product is None:
+                    self.remove(pk)
+                else:
+                    self.update(product)
+        self.built.set()
+
+    def run(self) -> None:
+        while True:
+            if self.built_at is not None:
+                time.sleep(INDEX_REFRESH_INTERVAL)
+            try:
+                self.build()
+            except Exception:
+                log.exception("Failed to build product name index")
+            finally:
+                connection.close()
+                # Поиск не ждёт вечно, если построить не удалось
+                self.built.set()
+
+    def start(self) -> None:
+        with self.lock:
+            if self.thread is None:
+                self.thread = Thread(
+                    target=self.run, name="product-name-index", daemon=True
+                )
+                self.thread.start()
+
+    def remove(self, pk: int) -> None:
+        with self.lock:
+            if self.changes is not None:
+                self.changes[pk] = None
+            self.discard(pk)
+
+    def discard(self, pk: int) -> None:
+        with self.lock:
+            name = self.names.pop(pk, None)
+            if name is None:
+                return
+            key = self.make_key(name, pk)
+            position = bisect_left(self.keys, key)
+            if position < len(self.keys) and self.keys[position] == key:
+                del self.keys[position]
+
+    def update(self, product: Product) -> None:
+        """
+        Применяет сохранение товара к уже построенному индексу.
+        """
+        with self.lock:
+            if self.changes is not None:
+                self.changes[product.pk] = product
+            if self.built_at is None:
+                return
+            self.discard(product.pk)
+            if not product.archived:
+                self.names[product.pk] = product.name
+                insort(self.keys, self.make_key(product.name, product.pk))
+
+    def search(self, prefix: str, limit: int = DEFAULT_LIMIT) -> list[dict]:
+        prefix = normalize(prefix.strip())
+        if not prefix:
+            return []
+        self.start()
+        self.built.wait()
+        results = []
+        with self.lock:
+            position = bisect_left(self.keys, prefix)
+            for key in self.keys[position : position + limit]:
+                if not key.startswith(prefix):
+                    break
+                pk = int(key.rsplit("\x00", 1)[1])
+                results.append({"pk": pk, "name": self.names[pk]})
+        return results
+
+    def stats(self) -> dict:
+        with self.lock:
+            memory = sys.getsizeof(self.keys) + sys.getsizeof(self.names)
+            memory += sum(map(sys.getsizeof, self.keys))
+            for pk, name in self.names.items():
+                memory += sys.getsizeof(pk) + sys.getsizeof(name)
+            age = None
+            if self.built_at is not None:
+                age = round(time.monotonic() - self.built_at, 1)
+            return {"size": len(self.keys), "memory_bytes": memory, "age": age}
+
+
+product_name_index = ProductNameIndex()
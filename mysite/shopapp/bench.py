@@ -0,0 +1,183 @@
+"""
+Бенчмарк страниц и API магазина в процессе, через тестовый Client.
+
+Данные создаются в транзакции, которая потом откатывается. Каждый
+эндпоинт запрашивается warmup + repeat раз: по замерам времени считаются
+p50/p95/p99, отдельно одним запросом под tracemalloc - пик выделенной
+памяти, и число SQL запросов.
+"""
+
+import tracemalloc
+from dataclasses import dataclass, field
+from statistics import quantiles
+from timeit import default_timer
+from typing import Callable
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Order, Product, ProductImage
+
+PRODUCTS_PER_ORDER = 3
+
+
+@dataclass
+class Endpoint:
+    name: str
+    url: Callable[[dict], str]
+    params: dict = field(default_factory=dict)
+
+
+ENDPOINTS = [
+    Endpoint("products_list", lambda data: reverse("shopapp:products_list")),
+    Endpoint(
+        "product_details",
+        lambda data: reverse("shopapp:product_details", kwargs={"pk": data["product"]}),
+    ),
+    Endpoint("api_products", lambda data: reverse("shopapp:product-list")),
+    Endpoint(
+        "api_products_search",
+        lambda data: reverse("shopapp:product-list"),
+        {"search": "product 1"},
+    ),
+    Endpoint("api_products_csv", lambda data: reverse("shopapp:product-download-csv")),
+    Endpoint("api_orders", lambda data: reverse("shopapp:order-list")),
+    Endpoint("products_export", lambda data: reverse("shopapp:products-export")),
+    Endpoint("orders_export", lambda data: reverse("shopapp:orders-export")),
+    Endpoint(
+        "user_orders_export",
+        lambda data: reverse(
+            "shopapp:user-orders-export", kwargs={"user_id": data["user"]}
+        ),
+    ),
+    Endpoint("products_feed", lambda data: reverse("shopapp:products-feed")),
+    Endpoint("sitemap", lambda data: reverse("django.contrib.sitemaps.views.sitemap")),
+]
+
+
+def seed(users: int, products: int, images: int, orders: int) -> dict:
+    """
+    Создаёт данные для замеров. images - картинок на товар.
+    Возвращает pk объектов для адресов эндпоинтов.
+    """
+    created_users = User.objects.bulk_create(
+        User(username=f"bench-user-{i}") for i in range(users)
+    )
+    created_products = Product.objects.bulk_create(
+        (
+            Product(
+                name=f"Bench product {i}",
+                description=f"Description of bench product {i}",
+                price=i % 1000,
+                discount=i % 50,
+                created_by=created_users[i % users],
+            )
+            for i in range(products)
+        ),
+        batch_size=5000,
+    )
+    ProductImage.objects.bulk_create(
+        (
+            ProductImage(product=product, image=f"products/bench/{product.pk}-{i}.jpg")
+            for product in created_products
+            for i in range(images)
+        ),
+        batch_size=5000,
+    )
+    created_orders = Order.objects.bulk_create(
+        (
+            Order(delivery_address=f"Bench street {i}", user=created_users[i % users])
+            for i in range(orders)
+        ),
+        batch_size=5000,
+    )
+    Order.products.through.objects.bulk_create(
+        (
+            Order.products.through(
+                order_id=order.pk,
+                product_id=created_products[(i * 7 + j) % products].pk,
+            )
+            for i, order in enumerate(created_orders)
+            for j in range(PRODUCTS_PER_ORDER)
+        ),
+        batch_size=5000,
+        ignore_conflicts=True,
+    )
+    Order.objects.recompute_totals()
+    return {"user": created_users[0].pk, "product": created_products[0].pk}
+
+
+def percentile_summary(samples: list[float]) -> dict:
+    cuts = quantiles(samples, n=100, method="inclusive")
+    return {
+        "p50_ms": round(cuts[49] * 1000, 3),
+        "p95_ms": round(cuts[94] * 1000, 3),
+        "p99_ms": round(cuts[98] * 1000, 3),
+    }
+
+
+def request(client: Client, url: str, params: dict):
+    response = client.get(url, params, HTTP_ACCEPT="application/json,text/html;q=0.9")
+    if response.streaming:
+        b"".join(response.streaming_content)
+    return response
+
+
+def bench_endpoint(
+    client: Client, endpoint: Endpoint, data: dict, repeat: int, warmup: int
+) -> dict:
+    url = endpoint.url(data)
+    for _ in range(warmup):
+        request(client, url, endpoint.params)
+    timings = []
+    for _ in range(repeat):
+        start = default_timer()
+        request(client, url, endpoint.params)
+        timings.append(default_timer() - start)
+    with CaptureQueriesContext(connection) as queries:
+        tracemalloc.start()
+        try:
+            response = request(client, url, endpoint.params)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {
+        "status": response.status_code,
+        **percentile_summary(timings),
+        "queries": len(queries),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(
+    client: Client, data: dict, repeat: int = 20, warmup: int = 2, only=None
+) -> dict:
+    results = {}
+    for endpoint in ENDPOINTS:
+        if only and endpoint.name not in only:
+            continue
+        results[endpoint.name] = bench_endpoint(client, endpoint, data, repeat, warmup)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> dict:
+    """
+    Сравнивает p50 и число запросов с сохранённым результатом.
+    Регрессия - p50 больше базового в threshold раз или больше запросов.
+    """
+    report = {}
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        ratio = current["p50_ms"] / previous["p50_ms"] if previous["p50_ms"] else None
+        report[name] = {
+            "p50_ratio": round(ratio, 3) if ratio is not None else None,
+            "queries_delta": current["queries"] - previous["queries"],
+            "regression": (ratio is not None and ratio > threshold)
+            or current["queries"] > previous["queries"],
+        }
+    return report
@@ -0,0 +1,190 @@
+"""
+Ключи кэша магазина с версиями.
+
+Вместо удаления записей из кэша при изменении данных увеличивается номер
+версии (поколение) группы данных, который входит в ключ. Старые записи
+просто перестают читаться и вытесняются бэкендом кэша сами.
+
+Группы:
+    products - товары и их картинки;
+    orders - все заказы;
+    user_orders:<id> - заказы одного пользователя.
+
+Версии увеличивают сигналы из shopapp.signals и QuerySet'ы моделей при
+массовых update/bulk_create, которые сигналы не посылают.
+
+Внутри транзакции версия увеличивается только после коммита: иначе
+параллельный запрос успел бы закэшировать ещё старые данные под новой
+версией, а откаченная запись оставила бы в кэше свои данные. Пока
+транзакция не закоммичена, её собственные чтения идут под ключами с
+меткой этой транзакции (PendingBump.token), которые больше никто не
+читает.
+"""
+
+import hashlib
+import json
+import time
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import HttpResponse
+
+PRODUCTS = "products"
+ORDERS = "orders"
+
+CATALOG_CACHE_TIMEOUT = 60 * 60
+USER_ORDERS_EXPORT_TIMEOUT = 60 * 60 * 6
+
+
+def get_versions(*names: str) -> list[int]:
+    keys = [f"version:{name}" for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Начинаем со времени, чтобы после вытеснения ключа версии
+            # не совпасть со старой версией и не прочитать устаревшие данные.
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key, 0)
+    return [versions[key] for key in keys]
+
+
+def increment_versions(*names: str) -> None:
+    for name in set(names):
+        key = f"version:{name}"
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+class PendingBump:
+    """
+    Callback on_commit, увеличивающий версии групп names.
+    """
+
+    def __init__(self, names: tuple[str, ...]):
+        self.names = frozenset(names)
+        self.token = uuid4().hex
+
+    def __call__(self) -> None:
+        increment_versions(*self.names)
+
+
+def bump_version(*names: str) -> None:
+    # Вне транзакции on_commit вызывает callback сразу
+    transaction.on_commit(PendingBump(names))
+
+
+def pending_tokens() -> dict[str, str]:
+    """
+    Метки групп, изменённых в текущей транзакции и ещё не закоммиченных.
+    Записи отката Django сам убирает из run_on_commit.
+    """
+    tokens = {}
+    for _, callback, _ in connection.run_on_commit:
+        if isinstance(callback, PendingBump):
+            for name in callback.names:
+                tokens[name] = callback.token
+    return tokens
+
+
+def versioned_key(key: str, *names: str) -> str:
+    versions = list(map(str, get_versions(*names)))
+    tokens = pending_tokens()
+    for i, name in enumerate(names):
+        if name in tokens:
+            versions[i] = f"{versions[i]}-{tokens[name]}"
+    return ":".join([key, *versions])
+
+
+def user_orders(user_id: int) -> str:
+    return f"user_orders:{user_id}"
+
+
+def user_orders_export_key(user_id: int) -> str:
+    return versioned_key(f"user_orders_export:{user_id}", user_orders(user_id))
+
+
+def bump_user_orders(*user_ids: int) -> None:
+    bump_version(*map(user_orders, user_ids))
+
+
+def count_cache_event(name: str) -> None:
+    key = f"stats:{name}"
+    if cache.add(key, 1, None):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+class CachedListMixin:
+    """
+    Кэш ответа list() для ViewSet'а.
+
+    Ключ строится из пути, нормализованных параметров фильтрации, поиска,
+    сортировки и страницы и типа ответа, а также версий list_cache_versions.
+    В кэше хранится уже отрендеренное тело ответа, а не HttpResponse.
+    Браузерный API (HTML) не кэшируется.
+    """
+
+    list_cache_versions: tuple[str, ...] = ()
+    list_cache_timeout = CATALOG_CACHE_TIMEOUT
+    list_cache_media_types = ("application/json",)
+
+    def get_list_cache_params(self) -> set[str]:
+        params = {"page", "page_size", "cursor", "count", "search", "ordering"}
+        params.update(getattr(self, "filterset_fields", ()))
+        return params
+
+    def get_list_cache_key(self, request) -> str:
+        allowed = self.get_list_cache_params()
+        params = sorted(
+            (name, sorted(values))
+            for name, values in request.query_params.lists()
+            if name in allowed
+        )
+        raw = json.dumps(
+            [request.get_host(), request.path, request.accepted_media_type, params]
+        )
+        digest = hashlib.md5(raw.encode()).hexdigest()
+        return versioned_key(
+            f"list:{self.basename}:{digest}", *self.list_cache_versions
+        )
+
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if renderer.media_type not in self.list_cache_media_types:
+            return super().list(request, *args, **kwargs)
+        cache_key = self.get_list_cache_key(request)
+        cached = cache.get(cache_key)
+        if cached is None:
+            count_cache_event(f"list:{self.basename}:misses")
+            response = super().list(request, *args, **kwargs)
+            content = renderer.render(
+                response.data, request.accepted_media_type, self.get_renderer_context()
+            )
+            content_type = renderer.media_type
+            if renderer.charset:
+                content_type = f"{content_type}; charset={renderer.charset}"
+            cached = content, content_type
+            cache.set(cache_key, cached, self.list_cache_timeout)
+        else:
+            count_cache_event(f"list:{self.basename}:hits")
+        content, content_type = cached
+        return HttpResponse(content, content_type=content_type)
+
+    def get_list_cache_stats(self) -> dict:
+        stats = cache.get_many(
+            [f"stats:list:{self.basename}:hits", f"stats:list:{self.basename}:misses"]
+        )
+        hits = stats.get(f"stats:list:{self.basename}:hits", 0)
+        misses = stats.get(f"stats:list:{self.basename}:misses", 0)
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else None,
+        }
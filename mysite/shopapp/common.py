@@ -1,12 +1,313 @@
-from csv import DictReader
+import json
+import os
+from csv import DictReader, writer
+from dataclasses import dataclass, field
 from io import TextIOWrapper
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Sequence
 
-from shopapp.models import Product
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, transaction
+from django.db.models import QuerySet
 
+from shopapp.csv_parallel import parse_csv_products_parallel
+from shopapp.models import Order, Product
 
-def save_csv_products(file, encoding):
-    csv_file = TextIOWrapper(file, encoding=encoding)
-    reader = DictReader(csv_file)
-    products = [Product(**row) for row in reader]
-    Product.objects.bulk_create(products)
-    return products
+PRODUCT_CSV_FIELDS = ("sku", "name", "description", "price", "discount", "archived")
+PRODUCT_EXPORT_FIELDS = ("name", "description", "price", "discount")
+MAX_REPORTED_ERRORS = 100
+
+
+class Echo:
+    """
+    Псевдо-буфер для csv.writer: вместо накопления строк сразу отдаёт их,
+    чтобы их можно было передавать в StreamingHttpResponse.
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def stream_csv_rows(fields: Sequence[str], rows: Iterable[Sequence]) -> Iterator[str]:
+    csv_writer = writer(Echo())
+    yield csv_writer.writerow(fields)
+    for row in rows:
+        yield csv_writer.writerow(row)
+
+
+ORDER_EXPORT_FIELDS = (
+    "id",
+    "address",
+    "promocode",
+    "user",
+    "products",
+    "products_count",
+    "total_amount",
+)
+
+
+def iter_orders_export(orders: QuerySet | None = None) -> Iterator[dict]:
+    """
+    Отдаёт заказы с именем пользователя и id товаров за два запроса
+    независимо от количества заказов: заказы и строки промежуточной
+    таблицы читаются отсортированными по id заказа и сливаются на лету.
+    """
+    if orders is None:
+        orders = Order.objects.all()
+    links = Order.products.through.objects.all()
+    if orders.query.has_filters():
+        links = links.filter(order__in=orders.values("pk"))
+    orders = (
+        orders.order_by("pk")
+        .values_list(
+            "pk",
+            "delivery_address",
+            "promocode",
+            "user__username",
+            "products_count",
+            "total_amount",
+        )
+        .iterator(chunk_size=2000)
+    )
+    links = (
+        links.order_by("order_id", "product_id")
+        .values_list("order_id", "product_id")
+        .iterator(chunk_size=2000)
+    )
+    link = next(links, None)
+    for pk, address, promocode, username, products_count, total_amount in orders:
+        products = []
+        while link is not None and link[0] <= pk:
+            if link[0] == pk:
+                products.append(link[1])
+            link = next(links, None)
+        yield {
+            "id": pk,
+            "address": address,
+            "promocode": promocode,
+            "user": username,
+            "products": products,
+            "products_count": products_count,
+            "total_amount": total_amount,
+        }
+
+
+def stream_json_list(key: str, items: Iterable) -> Iterator[str]:
+    yield f'{{"{key}": ['
+    separator = ""
+    for item in items:
+        yield separator + json.dumps(item, cls=DjangoJSONEncoder)
+        separator = ", "
+    yield "]}"
+
+
+def iter_batches(iterable: Iterable, batch_size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+@dataclass
+class CSVImportReport:
+    """
+    Итог импорта CSV: сколько строк записано и какие строки отклонены.
+    Номера строк считаются как в файле, заголовок - строка 1.
+    """
+
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    errors: list[dict] = field(default_factory=list)
+
+    def add_error(self, line: int, errors: dict) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "errors": errors})
+
+    def as_dict(self) -> dict:
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "failed": self.failed,
+            "errors": self.errors,
+        }
+
+
+def clean_product_row(row: dict) -> dict:
+    """
+    Приводит значения строки CSV к типам полей Product и проверяет их.
+    Пустые значения для полей со значением по умолчанию пропускаются.
+    """
+    data = {}
+    errors = {}
+    for name, value in row.items():
+        if name is None:
+            errors["__all__"] = ["Row has more values than columns."]
+            continue
+        if name not in PRODUCT_CSV_FIELDS:
+            errors[name] = ["Unknown column."]
+            continue
+        model_field = Product._meta.get_field(name)
+        if value in ("", None) and model_field.has_default():
+            continue
+        if value in ("", None) and model_field.null:
+            data[name] = None
+            continue
+        try:
+            data[name] = model_field.clean(value, None)
+        except ValidationError as exc:
+            errors[name] = exc.messages
+    if errors:
+        raise ValidationError(errors)
+    return data
+
+
+def upsert_products(
+    products: list[Product], update_fields: list[str]
+) -> tuple[int, int, int]:
+    """
+    Вставляет новые товары и обновляет существующие по sku одним запросом
+    на пачку. Строки, совпадающие с базой, не перезаписываются.
+    Возвращает количество вставленных, обновлённых и неизменённых строк.
+    """
+    existing = {
+        values["sku"]: values
+        for values in Product.objects.filter(
+            sku__in=[product.sku for product in products]
+        ).values("sku", *update_fields)
+    }
+    created = updated = unchanged = 0
+    changed = []
+    for product in products:
+        current = existing.get(product.sku)
+        if current is None:
+            created += 1
+        elif all(current[name] == getattr(product, name) for name in update_fields):
+            unchanged += 1
+            continue
+        else:
+            updated += 1
+        changed.append(product)
+    if changed and update_fields:
+        Product.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=["sku"],
+            update_fields=update_fields,
+        )
+    elif changed:
+        Product.objects.bulk_create(changed)
+    return created, updated, unchanged
+
+
+def iter_csv_product_rows(reader: DictReader) -> Iterator[tuple]:
+    """
+    Разбирает строки CSV в кортежи (номер строки, данные, ошибки).
+    Для корректной строки ошибки равны None, для некорректной - данные.
+    """
+    for row in reader:
+        try:
+            yield reader.line_num, clean_product_row(row), None
+        except ValidationError as exc:
+            yield reader.line_num, None, exc.message_dict
+
+
+def write_csv_products(
+    rows: Iterable[tuple],
+    fieldnames: Sequence[str],
+    batch_size: int,
+    upsert: bool = False,
+    progress: Callable[[int], None] | None = None,
+) -> CSVImportReport:
+    """
+    Пишет разобранные строки CSV в базу пачками по batch_size строк,
+    каждую пачку в отдельной транзакции.
+    После каждой пачки progress получает число обработанных строк.
+    """
+    processed = 0
+    update_fields = [
+        name for name in fieldnames if name in PRODUCT_CSV_FIELDS and name != "sku"
+    ]
+    report = CSVImportReport()
+    for batch in iter_batches(rows, batch_size):
+        processed += len(batch)
+        if progress:
+            progress(processed)
+        pending = {}
+        for line, data, errors in batch:
+            if errors:
+                report.add_error(line, errors)
+                continue
+            product = Product(**data)
+            if upsert and not product.sku:
+                report.add_error(line, {"sku": ["This field is required for upsert."]})
+                continue
+            key = product.sku if upsert else line
+            if key in pending:
+                report.add_error(
+                    pending[key][0], {"sku": [f"Overridden by line {line}."]}
+                )
+            pending[key] = (line, product)
+        if not pending:
+            continue
+        products = [product for line, product in pending.values()]
+        try:
+            with transaction.atomic():
+                if upsert:
+                    created, updated, unchanged = upsert_products(
+                        products, update_fields
+                    )
+                else:
+                    Product.objects.bulk_create(products)
+                    created, updated, unchanged = len(products), 0, 0
+        except DatabaseError as exc:
+            for line, product in pending.values():
+                report.add_error(line, {"__all__": [str(exc)]})
+            continue
+        report.created += created
+        report.updated += updated
+        report.unchanged += unchanged
+    return report
+
+
+def save_csv_products(
+    file,
+    encoding,
+    batch_size: int | None = None,
+    upsert: bool = False,
+    workers: int = 1,
+    progress: Callable[[int], None] | None = None,
+) -> CSVImportReport:
+    """
+    Импортирует товары из CSV пачками по batch_size строк.
+    Каждая пачка пишется в отдельной транзакции, поэтому память и
+    блокировка базы не зависят от размера файла.
+    С upsert=True товары с уже известным sku обновляются, а не дублируются.
+    При workers > 1 файл на диске разбирается параллельно в нескольких
+    процессах, см. shopapp.csv_parallel.
+    """
+    batch_size = batch_size or settings.CSV_IMPORT_BATCH_SIZE
+    path = getattr(file, "name", None)
+    if workers > 1 and isinstance(path, str) and os.path.isfile(path):
+        fieldnames, rows = parse_csv_products_parallel(path, encoding, workers)
+    else:
+        reader = DictReader(TextIOWrapper(file, encoding=encoding))
+        fieldnames, rows = reader.fieldnames or [], iter_csv_product_rows(reader)
+    return write_csv_products(
+        rows, fieldnames, batch_size, upsert=upsert, progress=progress
+    )
+
+
+def save_csv_orders(file, encoding, batch_size: int | None = None) -> int:
+    batch_size = batch_size or settings.CSV_IMPORT_BATCH_SIZE
+    reader = DictReader(TextIOWrapper(file, encoding=encoding))
+    created = 0
+    for batch in iter_batches(reader, batch_size):
+        with transaction.atomic():
+            Order.objects.bulk_create([Order(**row) for row in batch])
+        created += len(batch)
+    return created
@@ -0,0 +1,90 @@
+"""
+Параллельный разбор больших CSV файлов с товарами.
+
+Файл режется на куски по границам строк, каждый кусок декодируется,
+разбирается и проверяется в отдельном процессе, а запись в базу остаётся
+в одном процессе (см. shopapp.common.write_csv_products).
+Поля с переводом строки внутри кавычек в этом режиме не поддерживаются,
+кодировка файла должна быть совместима с ASCII (utf-8, cp1251 и т.п.).
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from csv import DictReader, reader as csv_reader
+from io import StringIO
+from typing import Iterator
+
+import django
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def split_file(path: str, chunk_size: int = CHUNK_SIZE) -> tuple[bytes, list]:
+    """
+    Возвращает строку заголовка и список диапазонов (start, end) в байтах,
+    каждый из которых заканчивается на границе строки.
+    """
+    with open(path, "rb") as file:
+        header = file.readline()
+        size = os.fstat(file.fileno()).st_size
+        ranges = []
+        start = file.tell()
+        while start < size:
+            file.seek(min(start + chunk_size, size))
+            file.readline()
+            end = file.tell()
+            ranges.append((start, end))
+            start = end
+    return header, ranges
+
+
+def init_worker() -> None:
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
+    django.setup()
+
+
+def parse_chunk(
+    path: str, encoding: str, fieldnames: list[str], start: int, end: int
+) -> tuple[list, int]:
+    """
+    Разбирает кусок файла и возвращает строки с номерами относительно
+    начала куска и количество физических строк в нём.
+    """
+    from shopapp.common import iter_csv_product_rows
+
+    with open(path, "rb") as file:
+        file.seek(start)
+        data = file.read(end - start)
+    reader = DictReader(StringIO(data.decode(encoding), newline=""), fieldnames)
+    return list(iter_csv_product_rows(reader)), data.count(b"\n")
+
+
+def parse_csv_products_parallel(
+    path: str, encoding: str, workers: int, chunk_size: int = CHUNK_SIZE
+) -> tuple[list[str], Iterator[tuple]]:
+    """
+    Разбирает CSV файл в workers процессах. Строки отдаются в порядке файла,
+    одновременно в памяти находится не больше 2 * workers кусков.
+    """
+    header, ranges = split_file(path, chunk_size)
+    fieldnames = next(csv_reader([header.decode(encoding)]), [])
+
+    def rows() -> Iterator[tuple]:
+        line_offset = 1
+        chunks = iter(ranges)
+        pending = deque()
+        with ProcessPoolExecutor(workers, initializer=init_worker) as executor:
+            while True:
+                while len(pending) < workers * 2 and (chunk := next(chunks, None)):
+                    pending.append(
+                        executor.submit(parse_chunk, path, encoding, fieldnames, *chunk)
+                    )
+                if not pending:
+                    break
+                chunk_rows, line_count = pending.popleft().result()
+                for line, data, errors in chunk_rows:
+                    yield line + line_offset, data, errors
+                line_offset += line_count
+
+    return fieldnames, rows()
@@ -38,3 +38,10 @@ class ProductForm(ModelForm):
 
 class CSVImportForm(forms.Form):
     csv_file = forms.FileField()
+
+
+class ProductCSVImportForm(CSVImportForm):
+    upsert = forms.BooleanField(
+        required=False,
+        help_text="Update products with the same SKU instead of adding duplicates",
+    )
@@ -0,0 +1,209 @@
+"""
+Фоновые задачи магазина.
+
+Задачи хранятся в модели Job и выполняются командой run_jobs, поэтому
+долгий импорт или экспорт не занимает воркер gunicorn. Задачу забирает
+тот процесс, чей атомарный UPDATE queued -> running прошёл первым.
+Пока задача выполняется, run_jobs обновляет heartbeat_at. Задачи, чей
+воркер перестал отвечать дольше HEARTBEAT_TIMEOUT, возвращаются в
+очередь, а после MAX_ATTEMPTS попыток помечаются failed. Импорт пишет
+каждую пачку в своей транзакции, поэтому повтор продублировал бы уже
+записанные строки: такие задачи сразу помечаются failed, а progress
+показывает, сколько строк успело обработаться.
+"""
+
+import logging
+from datetime import timedelta
+from tempfile import TemporaryFile
+from typing import Callable
+from urllib.parse import urlencode
+
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.db.models import F, Q
+from django.http import HttpRequest, QueryDict
+from django.utils import timezone
+from rest_framework.request import Request
+
+from .common import (
+    PRODUCT_EXPORT_FIELDS,
+    save_csv_orders,
+    save_csv_products,
+    stream_csv_rows,
+)
+from .models import Job
+
+log = logging.getLogger(__name__)
+
+HEARTBEAT_TIMEOUT = timedelta(minutes=5)
+MAX_ATTEMPTS = 3
+NOT_RETRIED_KINDS = ("import_products_csv", "import_orders_csv")
+
+JOB_HANDLERS: dict[str, Callable[[Job], dict]] = {}
+
+
+def job_handler(kind: str):
+    def register(func: Callable[[Job], dict]) -> Callable[[Job], dict]:
+        JOB_HANDLERS[kind] = func
+        return func
+
+    return register
+
+
+def enqueue_job(
+    kind: str, user: User | None = None, payload: dict | None = None, file=None
+) -> Job:
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind {kind!r}")
+    if user is not None and not user.is_authenticated:
+        user = None
+    return Job.objects.create(
+        kind=kind, created_by=user, payload=payload or {}, file=file
+    )
+
+
+def claim_job() -> Job | None:
+    queued = Job.objects.filter(status=Job.Status.QUEUED)
+    for pk in queued.values_list("pk", flat=True)[:20]:
+        now = timezone.now()
+        claimed = queued.filter(pk=pk).update(
+            status=Job.Status.RUNNING,
+            started_at=now,
+            heartbeat_at=now,
+            attempts=F("attempts") + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def heartbeat(*pks: int) -> None:
+    Job.objects.filter(pk__in=pks, status=Job.Status.RUNNING).update(
+        heartbeat_at=timezone.now()
+    )
+
+
+def recover_stale_jobs(timeout: timedelta = HEARTBEAT_TIMEOUT) -> tuple[int, int]:
+    """
+    Возвращает в очередь задачи running без heartbeat дольше timeout,
+    импорт и исчерпавшие попытки - помечает failed.
+    Возвращает (в очереди, failed).
+    """
+    deadline = timezone.now() - timeout
+    stale = Job.objects.filter(status=Job.Status.RUNNING).filter(
+        Q(heartbeat_at__lt=deadline)
+        | Q(heartbeat_at__isnull=True, started_at__lt=deadline)
+    )
+    pks = list(
+        stale.filter(
+            Q(attempts__gte=MAX_ATTEMPTS) | Q(kind__in=NOT_RETRIED_KINDS)
+        ).values_list("pk", flat=True)
+    )
+    failed = stale.filter(pk__in=pks).update(
+        status=Job.Status.FAILED,
+        error="Worker stopped responding",
+        finished_at=timezone.now(),
+    )
+    for job in Job.objects.filter(pk__in=pks, status=Job.Status.FAILED):
+        delete_input_file(job)
+    requeued = stale.update(status=Job.Status.QUEUED, progress=0)
+    if requeued or failed:
+        log.warning("Recovered stale jobs: %d requeued, %d failed", requeued, failed)
+    return requeued, failed
+
+
+def set_progress(job: Job, progress: int) -> None:
+    job.progress = progress
+    Job.objects.filter(pk=job.pk).update(progress=progress, heartbeat_at=timezone.now())
+
+
+def delete_input_file(job: Job) -> None:
+    if job.file:
+        job.file.delete(save=False)
+        Job.objects.filter(pk=job.pk).update(file="")
+
+
+def run_job(job: Job) -> Job:
+    log.info("Running %s", job)
+    try:
+        job.result = JOB_HANDLERS[job.kind](job)
+        job.status = Job.Status.DONE
+    except Exception as exc:
+        log.exception("%s failed", job)
+        job.error = str(exc)
+        job.status = Job.Status.FAILED
+    # Не в finally: если воркер прервали, файл нужен для повтора задачи
+    delete_input_file(job)
+    job.finished_at = timezone.now()
+    job.save(
+        update_fields=[
+            "status",
+            "result",
+            "result_file",
+            "error",
+            "progress",
+            "finished_at",
+        ]
+    )
+    return job
+
+
+def run_pending_jobs(limit: int | None = None) -> int:
+    """
+    Выполняет задачи из очереди в текущем потоке, пока они не закончатся.
+    """
+    count = 0
+    while limit is None or count < limit:
+        job = claim_job()
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+
+@job_handler("import_products_csv")
+def import_products_csv(job: Job) -> dict:
+    with job.file.open("rb") as file:
+        report = save_csv_products(
+            file,
+            encoding=job.payload.get("encoding", "utf-8"),
+            upsert=job.payload.get("upsert", False),
+            progress=lambda processed: set_progress(job, processed),
+        )
+    return report.as_dict()
+
+
+@job_handler("import_orders_csv")
+def import_orders_csv(job: Job) -> dict:
+    with job.file.open("rb") as file:
+        created = save_csv_orders(file, encoding=job.payload.get("encoding", "utf-8"))
+    job.progress = created
+    return {"created": created}
+
+
+@job_handler("export_products_csv")
+def export_products_csv(job: Job) -> dict:
+    from .views import ProductViewSet
+
+    request = HttpRequest()
+    request.method = "GET"
+    request.GET = QueryDict(urlencode(job.payload.get("params", {}), doseq=True))
+    view = ProductViewSet(
+        request=Request(request),
+        action="download_csv",
+        format_kwarg=None,
+        args=(),
+        kwargs={},
+    )
+    queryset = view.filter_queryset(view.get_queryset())
+    rows = queryset.values_list(*PRODUCT_EXPORT_FIELDS).iterator(chunk_size=2000)
+    written = 0
+    with TemporaryFile("w+b") as file:
+        for line in stream_csv_rows(PRODUCT_EXPORT_FIELDS, rows):
+            file.write(line.encode())
+            written += 1
+        file.seek(0)
+        job.result_file.save(f"products-export-{job.pk}.csv", File(file), save=False)
+    job.progress = written - 1
+    return {"rows": job.progress, "url": job.result_file.url}
@@ -2,7 +2,7 @@ from typing import Sequence
 from django.db import transaction
 from django.contrib.auth.models import User
 from django.core.management import BaseCommand
-from django.db.models import Avg, Max, Min, Count, Sum
+from django.db.models import Avg, Max, Min
 
 from shopapp.models import Order, Product
 
@@ -11,14 +11,12 @@ class Command(BaseCommand):
     @transaction.atomic
     def handle(self, *args, **options):
         self.stdout.write("Start demo aggregate")
-        orders = Order.objects.annotate(
-            total=Sum("products__price", default=0), products_count=Count("products")
-        )
-        for order in orders:
+        orders = Order.objects.values_list("id", "products_count", "total_amount")
+        for order_id, products_count, total in orders.iterator():
             print(
-                f"Order #{order.id}"
-                f"with {order.products_count}"
-                f"products worth {order.total}"
+                f"Order #{order_id}"
+                f"with {products_count}"
+                f"products worth {total}"
             )
         # result = Product.objects.aggregate(
         #     Avg("price"), Max("price"), min_price=Min("price"), count=Count("id")
@@ -0,0 +1,87 @@
+import json
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+from django.utils import translation
+
+from shopapp.bench import ENDPOINTS, compare, run_benchmarks, seed
+
+
+class Command(BaseCommand):
+    """
+    Benchmarks shop views and API endpoints in-process and prints JSON.
+    Seeded data is rolled back.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--images", type=int, default=1, help="Per product")
+        parser.add_argument("--orders", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument(
+            "--only",
+            nargs="+",
+            choices=[endpoint.name for endpoint in ENDPOINTS],
+            help="Endpoints to run",
+        )
+        parser.add_argument("--output", type=Path, help="Save results to a file")
+        parser.add_argument(
+            "--compare", type=Path, help="Compare with a saved baseline file"
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=1.2,
+            help="p50 ratio over baseline counted as regression",
+        )
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 2:
+            raise CommandError("--repeat must be at least 2")
+        with (
+            override_settings(ALLOWED_HOSTS=["testserver"], RATELIMIT_ENABLED=False),
+            translation.override("en"),
+            transaction.atomic(),
+        ):
+            data = seed(
+                options["users"],
+                options["products"],
+                options["images"],
+                options["orders"],
+            )
+            admin = User.objects.create_superuser("bench-admin")
+            client = Client()
+            client.force_login(admin)
+            results = run_benchmarks(
+                client,
+                data,
+                repeat=options["repeat"],
+                warmup=options["warmup"],
+                only=options["only"],
+            )
+            transaction.set_rollback(True)
+
+        output = {
+            "volumes": {
+                name: options[name]
+                for name in ("users", "products", "images", "orders")
+            },
+            "endpoints": results,
+        }
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(output, indent=2) + "\n")
+        if options["compare"]:
+            baseline = json.loads(Path(options["compare"]).read_text())
+            output["compare"] = compare(
+                results, baseline["endpoints"], options["threshold"]
+            )
+        self.stdout.write(json.dumps(output, indent=2))
+        if options["compare"] and any(
+            item["regression"] for item in output["compare"].values()
+        ):
+            raise CommandError("Performance regression against baseline")
@@ -0,0 +1,54 @@
+import os
+from collections import deque
+from csv import DictReader
+from tempfile import NamedTemporaryFile
+from timeit import default_timer
+
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from shopapp.common import iter_csv_product_rows, save_csv_products
+from shopapp.csv_parallel import parse_csv_products_parallel
+
+
+class Command(BaseCommand):
+    """
+    Compares serial and multi-process product CSV import on a generated file.
+    Everything written to the database is rolled back.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--workers", type=int, default=os.cpu_count())
+
+    def handle(self, *args, **options):
+        with NamedTemporaryFile("w", suffix=".csv", delete=False) as file:
+            file.write("name,description,price,discount,archived\n")
+            for i in range(options["rows"]):
+                file.write(f"Product {i},Description {i},{i % 5000}.99,{i % 50},0\n")
+        try:
+            for workers in sorted({1, options["workers"]}):
+                self.stdout.write(
+                    f"{options['rows']} rows, {workers} worker(s):"
+                    f" parse {self.parse(file.name, workers):.2f}s,"
+                    f" import {self.run(file.name, workers):.2f}s"
+                )
+        finally:
+            os.remove(file.name)
+
+    def parse(self, path: str, workers: int) -> float:
+        start = default_timer()
+        if workers > 1:
+            fieldnames, rows = parse_csv_products_parallel(path, "utf-8", workers)
+            deque(rows, maxlen=0)
+        else:
+            with open(path, encoding="utf-8", newline="") as file:
+                deque(iter_csv_product_rows(DictReader(file)), maxlen=0)
+        return default_timer() - start
+
+    def run(self, path: str, workers: int) -> float:
+        start = default_timer()
+        with transaction.atomic(), open(path, "rb") as file:
+            save_csv_products(file, encoding="utf-8", workers=workers)
+            transaction.set_rollback(True)
+        return default_timer() - start
@@ -0,0 +1,73 @@
+import copy
+import logging
+import logging.config
+import threading
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from timeit import default_timer
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from mysite import log_queue
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Compares logging throughput of request threads with the root handlers
+    called directly and behind the bounded queue of mysite.log_queue.
+    Records go to a rotating file in a temporary directory.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--records", type=int, default=5000, help="Per thread")
+
+    def handle(self, *args, **options):
+        self.threads, self.records = options["threads"], options["records"]
+        with TemporaryDirectory() as directory:
+            path = Path(directory, "bench.log")
+            config = copy.deepcopy(settings.LOGGING)
+            # Без ротации, чтобы после замера посчитать записанное
+            config["handlers"]["logfile"].update(filename=path, maxBytes=0)
+            config["root"]["handlers"] = ["logfile"]
+            try:
+                log_queue.stop_listener()
+                logging.config.dictConfig(config)
+                self.report("direct", self.run())
+
+                log_queue.configure(config)
+                path.write_text("")
+                start = default_timer()
+                self.report("queued, enqueue", self.run())
+                log_queue.stop_listener()
+                elapsed = default_timer() - start
+                with path.open() as file:
+                    written = sum("Benchmark record" in line for line in file)
+                self.report("queued, written", written / elapsed)
+                self.stdout.write(f"dropped: {self.total - written} records")
+            finally:
+                log_queue.stop_listener()
+                log_queue.configure(settings.LOGGING)
+
+    @property
+    def total(self) -> int:
+        return self.threads * self.records
+
+    def run(self) -> float:
+        def work():
+            for i in range(self.records):
+                log.info("Benchmark record %s", i)
+
+        threads = [threading.Thread(target=work) for _ in range(self.threads)]
+        start = default_timer()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.total / (default_timer() - start)
+
+    def report(self, title: str, rate: float) -> None:
+        self.stdout.write(f"{title}: {rate:.0f} records/s")
@@ -0,0 +1,67 @@
+from statistics import median
+from timeit import default_timer
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from shopapp.models import Product
+from shopapp.pagination import KeysetPagination
+
+
+class Command(BaseCommand):
+    """
+    Compares page number and keyset pagination of products on the first
+    and a deep page. Seeded products are rolled back.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page", type=int, default=10_000)
+        parser.add_argument("--page-size", type=int, default=10)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        page, page_size = options["page"], options["page_size"]
+        self.repeat = options["repeat"]
+        self.factory = APIRequestFactory()
+        with transaction.atomic():
+            Product.objects.bulk_create(
+                (
+                    Product(name=f"Product {i:07d}", price=i % 1000, created_by=None)
+                    for i in range(page * page_size + page_size)
+                ),
+                batch_size=5000,
+            )
+            queryset = Product.objects.all()
+            for number in 1, page:
+                params = {"page": number, "page_size": page_size}
+                self.report(f"page number, page {number}", queryset, params)
+
+            paginator = KeysetPagination()
+            paginator.ordering = paginator.get_ordering(queryset)
+            offset = (page - 1) * page_size
+            anchor = queryset.order_by(*paginator.ordering)[offset - 1]
+            cursor = paginator.encode_cursor(paginator.position(anchor), False)
+            self.report(
+                "keyset, page 1", queryset, {"page_size": page_size}, KeysetPagination
+            )
+            self.report(
+                f"keyset, page {page}",
+                queryset,
+                {"page_size": page_size, "cursor": cursor},
+                KeysetPagination,
+            )
+            transaction.set_rollback(True)
+
+    def report(self, title, queryset, params, pagination_class=PageNumberPagination):
+        timings = []
+        for _ in range(self.repeat):
+            paginator = pagination_class()
+            paginator.page_size_query_param = "page_size"
+            request = Request(self.factory.get("/", params))
+            start = default_timer()
+            paginator.paginate_queryset(queryset, request)
+            timings.append(default_timer() - start)
+        self.stdout.write(f"{title}: {median(timings) * 1000:.2f} ms")
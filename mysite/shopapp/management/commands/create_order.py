@@ -1,4 +1,3 @@
-from typing import Sequence
 from django.db import transaction
 from django.contrib.auth.models import User
 from django.core.management import BaseCommand
@@ -14,13 +13,12 @@ class Command(BaseCommand):
         # products: Sequence[Product] = Product.objects.defer(
         #     "description", "price", "created_at"
         # ).all()
-        products: Sequence[Product] = Product.objects.only("id").all()
+        product_ids = Product.objects.values_list("pk", flat=True)
         order, created = Order.objects.get_or_create(
             delivery_address="ul Ivanova, d 8",
             promocode="promo5",
             user=user,
         )
-        for product in products:
-            order.products.add(product)
+        order.set_products_bulk(product_ids)
         order.save()
         self.stdout.write(f"Created order {order}")
@@ -0,0 +1,218 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from timeit import default_timer
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from shopapp.cache import ORDERS, bump_version
+from shopapp.models import Order, Product
+
+DISCOUNTS = (0, 5, 10, 20, 30, 50)
+DISCOUNT_WEIGHTS = (0.6, 0.1, 0.1, 0.1, 0.05, 0.05)
+
+
+class Command(BaseCommand):
+    """
+    Generates a large reproducible dataset of users, products, orders and
+    order lines for load and scale testing.
+
+    Users and products are written with bulk_create, orders and order lines
+    with raw batched INSERTs, each chunk in its own transaction. Run it on
+    an idle database: order ids are assigned by the command.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--products", type=int, default=100_000)
+        parser.add_argument("--orders", type=int, default=100_000)
+        parser.add_argument(
+            "--lines", type=float, default=4, help="Mean products per order"
+        )
+        parser.add_argument(
+            "--lines-distribution", choices=("poisson", "uniform"), default="poisson"
+        )
+        parser.add_argument(
+            "--popularity",
+            type=float,
+            default=1.0,
+            help="Zipf exponent of product popularity, 0 for uniform",
+        )
+        parser.add_argument(
+            "--prices", choices=("lognormal", "uniform"), default="lognormal"
+        )
+        parser.add_argument(
+            "--days", type=int, default=365, help="Spread orders over last N days"
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--prefix", default="gen", help="Username prefix")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--chunk-size", type=int, default=50_000, help="Rows per transaction"
+        )
+
+    def handle(self, *args, **options):
+        if options["users"] < 1 or options["products"] < 1:
+            raise CommandError("At least one user and one product are required")
+        self.options = options
+        self.batch_size = options["batch_size"]
+        self.chunk_size = options["chunk_size"]
+        self.rng = np.random.default_rng(options["seed"])
+        started = default_timer()
+        user_ids = self.timed("users", self.generate_users)
+        product_ids = self.timed("products", self.generate_products, user_ids)
+        self.timed("orders", self.generate_orders, user_ids, product_ids)
+        bump_version(ORDERS)
+        total = default_timer() - started
+        self.stdout.write(self.style.SUCCESS(f"Done in {total:.1f} s"))
+
+    def timed(self, name: str, generate, *args):
+        start = default_timer()
+        result, rows = generate(*args)
+        elapsed = default_timer() - start
+        rate = rows / elapsed if elapsed else 0
+        self.stdout.write(f"{name}: {rows} rows in {elapsed:.1f} s, {rate:.0f} rows/s")
+        return result
+
+    def chunks(self, count: int):
+        for start in range(0, count, self.chunk_size):
+            yield start, min(start + self.chunk_size, count)
+
+    def generate_users(self):
+        prefix, count = self.options["prefix"], self.options["users"]
+        ids = []
+        for start, end in self.chunks(count):
+            with transaction.atomic():
+                users = User.objects.bulk_create(
+                    (
+                        User(username=f"{prefix}-{i}", password="!")
+                        for i in range(start, end)
+                    ),
+                    batch_size=self.batch_size,
+                )
+            ids.extend(user.pk for user in users)
+        return np.array(ids), count
+
+    def generate_prices(self, count: int) -> np.ndarray:
+        if self.options["prices"] == "uniform":
+            prices = self.rng.uniform(1, 1000, count)
+        else:
+            prices = self.rng.lognormal(np.log(50), 1.0, count)
+        return np.clip(prices, 1, 999_999).round(2)
+
+    def generate_products(self, user_ids: np.ndarray):
+        count = self.options["products"]
+        prices = self.generate_prices(count)
+        discounts = self.rng.choice(DISCOUNTS, count, p=DISCOUNT_WEIGHTS)
+        owners = self.rng.choice(user_ids, count)
+        ids = []
+        for start, end in self.chunks(count):
+            with transaction.atomic():
+                products = Product.objects.bulk_create(
+                    (
+                        Product(
+                            name=f"Product {i}",
+                            description=f"Generated product {i}",
+                            price=Decimal(f"{prices[i]:.2f}"),
+                            discount=int(discounts[i]),
+                            created_by_id=int(owners[i]),
+                        )
+                        for i in range(start, end)
+                    ),
+                    batch_size=self.batch_size,
+                )
+            ids.extend(product.pk for product in products)
+        return np.array(ids), count
+
+    def product_weights(self, count: int) -> np.ndarray | None:
+        exponent = self.options["popularity"]
+        if not exponent:
+            return None
+        weights = 1 / np.arange(1, count + 1) ** exponent
+        return weights / weights.sum()
+
+    def lines_per_order(self, count: int) -> np.ndarray:
+        mean = self.options["lines"]
+        if self.options["lines_distribution"] == "uniform":
+            return self.rng.integers(1, max(2, round(2 * mean)), count)
+        return self.rng.poisson(max(mean - 1, 0), count) + 1
+
+    def generate_orders(self, user_ids: np.ndarray, product_ids: np.ndarray):
+        count = self.options["orders"]
+        weights = self.product_weights(len(product_ids))
+        until = timezone.make_aware(
+            datetime.combine(timezone.localdate() + timedelta(days=1), time.min)
+        )
+        period = timedelta(days=self.options["days"]).total_seconds()
+        first_id = (Order.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+        rows = 0
+        for start, end in self.chunks(count):
+            size = end - start
+            order_ids = np.arange(first_id + start, first_id + end)
+            owners = self.rng.choice(user_ids, size)
+            # Заказы идут по времени в порядке id, равномерно по периоду
+            position = (np.arange(start, end) + self.rng.random(size)) / count
+            offsets = period * (1 - position)
+            lines = np.minimum(self.lines_per_order(size), len(product_ids))
+            line_orders = np.repeat(order_ids, lines)
+            line_products = self.rng.choice(product_ids, lines.sum(), p=weights)
+            # Без повторов товара в заказе (уникальность в промежуточной таблице)
+            pairs = np.unique(np.stack([line_orders, line_products], axis=1), axis=0)
+            with transaction.atomic():
+                self.insert_orders(order_ids, owners, until, offsets)
+                self.insert_lines(pairs)
+                Order.objects.filter(
+                    pk__gte=order_ids[0], pk__lte=order_ids[-1]
+                ).recompute_totals()
+            rows += size + len(pairs)
+            self.stdout.write(f"  orders {end}/{count}, lines {len(pairs)}")
+        return None, rows
+
+    def insert_many(self, model, fields: list[str], rows) -> None:
+        quote = connection.ops.quote_name
+        columns = ", ".join(
+            quote(model._meta.get_field(name).column) for name in fields
+        )
+        placeholders = ", ".join(["%s"] * len(fields))
+        sql = (
+            f"INSERT INTO {quote(model._meta.db_table)} ({columns})"
+            f" VALUES ({placeholders})"
+        )
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), self.batch_size):
+                cursor.executemany(sql, rows[start : start + self.batch_size])
+
+    def insert_orders(self, order_ids, owners, until, offsets) -> None:
+        adapt = connection.ops.adapt_datetimefield_value
+        rows = [
+            (
+                int(pk),
+                f"Street {pk}",
+                "",
+                adapt(until - timedelta(seconds=float(offset))),
+                int(owner),
+                "",
+                0,
+                0,
+            )
+            for pk, owner, offset in zip(order_ids, owners, offsets)
+        ]
+        fields = [
+            "id",
+            "delivery_address",
+            "promocode",
+            "created_at",
+            "user",
+            "receipt",
+            "total_amount",
+            "products_count",
+        ]
+        self.insert_many(Order, fields, rows)
+
+    def insert_lines(self, pairs: np.ndarray) -> None:
+        rows = pairs.tolist()
+        self.insert_many(Order.products.through, ["order", "product"], rows)
@@ -0,0 +1,35 @@
+from django.core.management import BaseCommand
+
+from shopapp.common import save_csv_products
+
+
+class Command(BaseCommand):
+    """
+    Imports products from a CSV file on disk
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--encoding", default="utf-8")
+        parser.add_argument("--batch-size", type=int)
+        parser.add_argument("--workers", type=int, default=1)
+        parser.add_argument("--upsert", action="store_true")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Import products from {options['path']}")
+        with open(options["path"], "rb") as file:
+            report = save_csv_products(
+                file,
+                encoding=options["encoding"],
+                batch_size=options["batch_size"],
+                upsert=options["upsert"],
+                workers=options["workers"],
+            )
+        for error in report.errors:
+            self.stderr.write(f"Line {error['line']}: {error['errors']}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {report.created}, updated {report.updated},"
+                f" unchanged {report.unchanged}, failed {report.failed}"
+            )
+        )
@@ -0,0 +1,30 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+
+from shopapp.search import PRODUCT_FTS_TABLE
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the product full-text search index from the products table
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--optimize", action="store_true", help="Merge index segments after rebuild"
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("Full-text search index is only used on SQLite")
+        with connection.cursor() as cursor:
+            self.stdout.write("Rebuild product search index")
+            cursor.execute(
+                f"INSERT INTO {PRODUCT_FTS_TABLE}({PRODUCT_FTS_TABLE}) VALUES ('rebuild')"
+            )
+            if options["optimize"]:
+                cursor.execute(
+                    f"INSERT INTO {PRODUCT_FTS_TABLE}({PRODUCT_FTS_TABLE})"
+                    " VALUES ('optimize')"
+                )
+        self.stdout.write(self.style.SUCCESS("Done"))
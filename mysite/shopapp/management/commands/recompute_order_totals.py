@@ -0,0 +1,26 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from shopapp.models import Order
+
+
+class Command(BaseCommand):
+    """
+    Recomputes Order.total_amount and products_count from order products.
+    Repairs drift after raw SQL or other writes that bypass signals.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        last_pk = Order.objects.aggregate(last=Max("pk"))["last"] or 0
+        updated = 0
+        for start in range(0, last_pk + 1, batch_size):
+            orders = Order.objects.filter(pk__gte=start, pk__lt=start + batch_size)
+            with transaction.atomic():
+                updated += orders.recompute_totals()
+            self.stdout.write(f"Recomputed {updated} orders")
+        self.stdout.write(self.style.SUCCESS("Done"))
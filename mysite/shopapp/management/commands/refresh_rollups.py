@@ -0,0 +1,30 @@
+from datetime import date
+
+from django.core.management import BaseCommand
+
+from shopapp.rollups import refresh_rollups
+
+
+class Command(BaseCommand):
+    """
+    Refreshes daily sales rollups for orders created since the last run.
+    Safe to run repeatedly (e.g. from cron).
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            type=date.fromisoformat,
+            help="Recompute days starting from this date (YYYY-MM-DD)",
+        )
+
+    def handle(self, *args, **options):
+        result = refresh_rollups(options["since"])
+        if result["since"] is None:
+            self.stdout.write("No orders to aggregate")
+            return
+        self.stdout.write(
+            f"Refreshed {result['days']} days and {result['product_days']}"
+            f" product days since {result['since']}"
+        )
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,16 @@
+from django.core.management import BaseCommand
+
+from shopapp.pagination import refresh_table_counts
+
+
+class Command(BaseCommand):
+    """
+    Refreshes cached table counts used by API and admin pagination.
+    run_jobs refreshes them every TABLE_COUNT_REFRESH_INTERVAL seconds;
+    without a job worker run this command periodically (e.g. from cron).
+    """
+
+    def handle(self, *args, **options):
+        for label, count in refresh_table_counts().items():
+            self.stdout.write(f"{label}: {count}")
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,80 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.db import connection
+
+from shopapp.jobs import (
+    HEARTBEAT_TIMEOUT,
+    claim_job,
+    heartbeat,
+    recover_stale_jobs,
+    run_job,
+)
+from shopapp.models import Job
+from shopapp.pagination import TABLE_COUNT_REFRESH_INTERVAL, refresh_table_counts
+
+
+class Command(BaseCommand):
+    """
+    Runs queued shop jobs in a thread pool.
+
+    While jobs run, their heartbeat is refreshed every --interval seconds.
+    Running jobs of any worker whose heartbeat is older than
+    --stale-timeout are requeued (or failed after too many attempts).
+    Table counts used by pagination are refreshed here as well, so
+    requests never pay for COUNT(*).
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--interval", type=float, default=1.0)
+        parser.add_argument(
+            "--stale-timeout",
+            type=float,
+            default=HEARTBEAT_TIMEOUT.total_seconds(),
+            help="Seconds without heartbeat after which a running job is recovered",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit when the queue is empty"
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        stale_timeout = timedelta(seconds=options["stale_timeout"])
+        self.stdout.write(f"Run jobs with {workers} workers")
+        running: dict = {}
+        checked_at = counted_at = 0.0
+        with ThreadPoolExecutor(workers) as executor:
+            while True:
+                if time.monotonic() - checked_at >= options["interval"]:
+                    checked_at = time.monotonic()
+                    if running:
+                        heartbeat(*running.values())
+                    recover_stale_jobs(stale_timeout)
+                if time.monotonic() - counted_at >= TABLE_COUNT_REFRESH_INTERVAL:
+                    counted_at = time.monotonic()
+                    refresh_table_counts()
+                job = claim_job() if len(running) < workers else None
+                if job is not None:
+                    running[executor.submit(self.run_job, job)] = job.pk
+                    continue
+                if not running and options["once"]:
+                    break
+                if running:
+                    done, _ = wait(
+                        running, options["interval"], return_when=FIRST_COMPLETED
+                    )
+                    for future in done:
+                        del running[future]
+                else:
+                    time.sleep(options["interval"])
+        self.stdout.write(self.style.SUCCESS("Done"))
+
+    def run_job(self, job: Job) -> None:
+        try:
+            job = run_job(job)
+            self.stdout.write(f"{job}: {job.result or job.error}")
+        finally:
+            connection.close()
@@ -0,0 +1,19 @@
+import json
+
+from django.core.management import BaseCommand
+
+from shopapp.analytics import CHUNK_SIZE, shop_analytics
+
+
+class Command(BaseCommand):
+    """
+    Prints catalog and sales analytics as JSON
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+        parser.add_argument("--indent", type=int, default=2)
+
+    def handle(self, *args, **options):
+        result = shop_analytics(chunk_size=options["chunk_size"])
+        self.stdout.write(json.dumps(result, indent=options["indent"]))
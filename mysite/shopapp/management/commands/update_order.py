@@ -10,15 +10,12 @@ class Command(BaseCommand):
             self.stdout.write("no order found")
             return
 
-        products = Product.objects.all()
+        product_ids = Product.objects.values_list("pk", flat=True)
 
-        for product in products:
-            order.products.add(product)
+        added, removed = order.set_products_bulk(product_ids)
 
         order.save()
 
         self.stdout.write(
-            self.style.SUCCESS(
-                f"Successfully added products {order.products.all()} to order {order}"
-            )
+            self.style.SUCCESS(f"Successfully added {added} products to order {order}")
         )
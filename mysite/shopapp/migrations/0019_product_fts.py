@@ -0,0 +1,67 @@
+from django.db import migrations
+
+FTS_SQL = [
+    """
+    CREATE VIRTUAL TABLE shopapp_product_fts USING fts5(
+        name,
+        description,
+        content='shopapp_product',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER shopapp_product_fts_insert AFTER INSERT ON shopapp_product
+    BEGIN
+        INSERT INTO shopapp_product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER shopapp_product_fts_delete AFTER DELETE ON shopapp_product
+    BEGIN
+        INSERT INTO shopapp_product_fts(shopapp_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER shopapp_product_fts_update
+    AFTER UPDATE OF name, description ON shopapp_product
+    BEGIN
+        INSERT INTO shopapp_product_fts(shopapp_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO shopapp_product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO shopapp_product_fts(shopapp_product_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_insert",
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_delete",
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_update",
+    "DROP TABLE IF EXISTS shopapp_product_fts",
+]
+
+
+def run_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopapp", "0018_job"),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sqlite(FTS_SQL), run_sqlite(DROP_SQL)),
+    ]
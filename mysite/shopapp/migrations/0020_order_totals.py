@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:16
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_totals(apps, schema_editor):
+    Order = apps.get_model("shopapp", "Order")
+    items = (
+        Order.products.through.objects.filter(order_id=OuterRef("pk"))
+        .order_by()
+        .values("order_id")
+    )
+    Order.objects.update(
+        total_amount=Coalesce(
+            Subquery(items.annotate(total=Sum("product__price")).values("total")),
+            Decimal(0),
+            output_field=models.DecimalField(),
+        ),
+        products_count=Coalesce(
+            Subquery(items.annotate(count=Count("product_id")).values("count")), 0
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopapp", "0019_product_fts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="products_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="total_amount",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
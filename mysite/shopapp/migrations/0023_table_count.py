@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopapp", "0022_job_heartbeat"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TableCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("table", models.CharField(max_length=100, unique=True)),
+                ("count", models.PositiveBigIntegerField()),
+                ("refreshed_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopapp", "0023_table_count"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductSearchIndex",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        db_column="rowid",
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="search_index",
+                        serialize=False,
+                        to="shopapp.product",
+                    ),
+                ),
+                ("match", models.TextField(db_column="shopapp_product_fts")),
+                ("rank", models.FloatField()),
+            ],
+            options={
+                "db_table": "shopapp_product_fts",
+                "managed": False,
+            },
+        ),
+    ]
@@ -1,10 +1,130 @@
+from decimal import Decimal
 from fileinput import filename
 
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.signals import m2m_changed
+from django.db.models.functions import Coalesce
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
+from .cache import ORDERS, PRODUCTS, bump_user_orders, bump_version
+
+
+class ProductQuerySet(models.QuerySet):
+    """
+    Массовые update/bulk_create не посылают сигналы, поэтому версию кэша
+    товаров увеличиваем здесь.
+    """
+
+    def update(self, **kwargs):
+        product_ids = None
+        if "price" in kwargs:
+            product_ids = list(self.values_list("pk", flat=True))
+        rows = super().update(**kwargs)
+        if rows:
+            bump_version(PRODUCTS)
+        if product_ids:
+            Order.objects.filter(products__in=product_ids).recompute_totals()
+        return rows
+
+    def bulk_create(
+        self,
+        objs,
+        batch_size=None,
+        ignore_conflicts=False,
+        update_conflicts=False,
+        update_fields=None,
+        unique_fields=None,
+    ):
+        objs = super().bulk_create(
+            objs,
+            batch_size=batch_size,
+            ignore_conflicts=ignore_conflicts,
+            update_conflicts=update_conflicts,
+            update_fields=update_fields,
+            unique_fields=unique_fields,
+        )
+        if objs:
+            bump_version(PRODUCTS)
+        if objs and update_conflicts and "price" in update_fields:
+            # Не все бэкенды возвращают pk обновлённых строк,
+            # поэтому товары ищем по unique_fields
+            products = self.model.objects.filter(
+                **{
+                    f"{name}__in": {getattr(product, name) for product in objs}
+                    for name in unique_fields
+                }
+            )
+            Order.objects.filter(products__in=products).recompute_totals()
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        if rows:
+            bump_version(PRODUCTS)
+        if rows and "price" in fields:
+            product_ids = [product.pk for product in objs]
+            Order.objects.filter(products__in=product_ids).recompute_totals()
+        return rows
+
+
+class OrderQuerySet(models.QuerySet):
+    """
+    То же для заказов: сбрасываем общую версию и версии владельцев.
+    """
+
+    def update(self, **kwargs):
+        user_ids = set(self.values_list("user_id", flat=True).distinct())
+        rows = super().update(**kwargs)
+        if rows:
+            new_owner = kwargs.get("user_id", getattr(kwargs.get("user"), "pk", None))
+            if isinstance(new_owner, int):
+                user_ids.add(new_owner)
+            bump_version(ORDERS)
+            bump_user_orders(*user_ids)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if objs:
+            bump_version(ORDERS)
+            bump_user_orders(*(order.user_id for order in objs))
+        return objs
+
+    def bulk_update(self, objs, *args, **kwargs):
+        rows = super().bulk_update(objs, *args, **kwargs)
+        if rows:
+            bump_version(ORDERS)
+            bump_user_orders(*(order.user_id for order in objs))
+        return rows
+
+    def add_to_totals(self, amount: Decimal, count: int) -> int:
+        return self.update(
+            total_amount=F("total_amount") + amount,
+            products_count=F("products_count") + count,
+        )
+
+    def recompute_totals(self) -> int:
+        """
+        Пересчитывает total_amount и products_count по товарам заказа
+        одним UPDATE с подзапросами.
+        """
+        items = (
+            self.model.products.through.objects.filter(order_id=OuterRef("pk"))
+            .order_by()
+            .values("order_id")
+        )
+        total = items.annotate(total=Sum("product__price")).values("total")
+        count = items.annotate(count=Count("product_id")).values("count")
+        return self.update(
+            total_amount=Coalesce(
+                Subquery(total), Decimal(0), output_field=models.DecimalField()
+            ),
+            products_count=Coalesce(Subquery(count), 0),
+        )
+
 
 def product_preview_directory_path(instanse: "Product", filename: str) -> str:
     return "products/product_{pk}/preview/{filename}".format(
@@ -13,8 +133,58 @@ def product_preview_directory_path(instanse: "Product", filename: str) -> str:
     )
 
 
-def get_deleted_user():
-    return User.objects.get_or_create(username="deleted_user")[0]
+DELETED_USERNAME = "deleted_user"
+_deleted_user_pk: int | None = None
+
+
+def get_deleted_user() -> int:
+    """
+    pk пользователя-заглушки, значение по умолчанию для Product.created_by.
+
+    Django вызывает его для каждого товара без автора, поэтому pk
+    запоминается на процесс. Внутри транзакции на процесс запоминаем
+    только после коммита: при откате (и в TestCase) пользователя может
+    не остаться. До коммита pk берём из callback on_commit этой
+    транзакции, откат Django сам убирает его из run_on_commit.
+    Кэш сбрасывают удаление пользователя и post_migrate (flush в тестах),
+    см. shopapp.signals.
+    """
+    global _deleted_user_pk
+    if _deleted_user_pk is not None:
+        return _deleted_user_pk
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        # callback добавлен первым вызовом в транзакции, он ближе к началу
+        for _, callback, _ in connection.run_on_commit:
+            if isinstance(callback, RememberDeletedUser) and callback.pk:
+                return callback.pk
+    pk = User.objects.get_or_create(username=DELETED_USERNAME)[0].pk
+    if connection.in_atomic_block:
+        transaction.on_commit(RememberDeletedUser(pk))
+    else:
+        _deleted_user_pk = pk
+    return pk
+
+
+class RememberDeletedUser:
+    """
+    Callback on_commit, запоминающий pk пользователя-заглушки на процесс.
+    """
+
+    def __init__(self, pk: int):
+        self.pk: int | None = pk
+
+    def __call__(self) -> None:
+        global _deleted_user_pk
+        _deleted_user_pk = self.pk
+
+
+def clear_deleted_user_cache() -> None:
+    global _deleted_user_pk
+    _deleted_user_pk = None
+    for _, callback, _ in transaction.get_connection().run_on_commit:
+        if isinstance(callback, RememberDeletedUser):
+            callback.pk = None
 
 
 class Product(models.Model):
@@ -30,6 +200,7 @@ class Product(models.Model):
         verbose_name_plural = _("Products")
 
     name = models.CharField(max_length=100, db_index=True)
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     description = models.TextField(null=False, blank=True, db_index=True)
     price = models.DecimalField(default=0, max_digits=8, decimal_places=2)
     discount = models.SmallIntegerField(default=0)
@@ -42,6 +213,8 @@ class Product(models.Model):
         null=True, blank=True, upload_to=product_preview_directory_path
     )
 
+    objects = ProductQuerySet.as_manager()
+
     def get_absolute_url(self):
         return reverse("shopapp:product_details", kwargs={"pk": self.pk})
 
@@ -49,6 +222,29 @@ class Product(models.Model):
         return f"Product(pk={self.pk}, name={self.name!r})"
 
 
+class ProductSearchIndex(models.Model):
+    """
+    FTS5 таблица поиска товаров (миграция 0019), см. shopapp.search.
+    Таблицу ведут триггеры SQLite, модель нужна только для JOIN в запросах.
+    """
+
+    class Meta:
+        managed = False
+        db_table = "shopapp_product_fts"
+
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column="rowid",
+        related_name="search_index",
+    )
+    # Скрытые столбцы FTS5: "таблица = запрос" работает как MATCH,
+    # rank - это bm25 для найденной строки
+    match = models.TextField(db_column="shopapp_product_fts")
+    rank = models.FloatField()
+
+
 def product_images_directory_path(instanse: "ProductImage", filename: str) -> str:
     return "products/product_{pk}/images/{filename}".format(
         pk=instanse.product.pk,
@@ -71,7 +267,168 @@ class Order(models.Model):
 
     delivery_address = models.TextField(null=True, blank=True)
     promocode = models.CharField(max_length=20, null=False, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     user = models.ForeignKey(User, on_delete=models.PROTECT)
     products = models.ManyToManyField(Product, related_name="orders")
+    total_amount = models.DecimalField(default=0, max_digits=12, decimal_places=2)
+    products_count = models.PositiveIntegerField(default=0)
     receipt = models.FileField(null=True, upload_to="orders/receipts/")
+
+    objects = OrderQuerySet.as_manager()
+
+    def set_products_bulk(self, products, batch_size: int = 1000) -> tuple[int, int]:
+        """
+        Делает состав заказа равным products (товары или их pk).
+
+        В отличие от products.set() текущий состав читается одним запросом,
+        а строки промежуточной таблицы удаляются и вставляются пачками по
+        batch_size. m2m_changed отправляется как у products.set(): по одной
+        паре pre/post_remove и pre/post_add на весь набор.
+        Возвращает (добавлено, удалено).
+        """
+        through = Order.products.through
+        db = router.db_for_write(through, instance=self)
+        wanted = {getattr(product, "pk", product) for product in products}
+        with transaction.atomic(using=db):
+            existing = set(
+                through.objects.using(db)
+                .filter(order_id=self.pk)
+                .values_list("product_id", flat=True)
+            )
+            removed = existing - wanted
+            added = wanted - existing
+            if removed:
+                self._send_products_changed("pre_remove", removed, db)
+                removed_ids = sorted(removed)
+                for start in range(0, len(removed_ids), batch_size):
+                    through.objects.using(db).filter(
+                        order_id=self.pk,
+                        product_id__in=removed_ids[start : start + batch_size],
+                    ).delete()
+                self._send_products_changed("post_remove", removed, db)
+            if added:
+                self._send_products_changed("pre_add", added, db)
+                through.objects.using(db).bulk_create(
+                    (through(order_id=self.pk, product_id=pk) for pk in sorted(added)),
+                    batch_size=batch_size,
+                )
+                self._send_products_changed("post_add", added, db)
+        return len(added), len(removed)
+
+    def _send_products_changed(self, action: str, pk_set: set, using: str) -> None:
+        m2m_changed.send(
+            sender=Order.products.through,
+            instance=self,
+            action=action,
+            reverse=False,
+            model=Product,
+            pk_set=pk_set,
+            using=using,
+        )
+
+
+class Job(models.Model):
+    """
+    Фоновая задача магазина (импорт, экспорт), выполняется командой run_jobs.
+
+    Обработчики задач тут: :mod:`shopapp.jobs`
+    """
+
+    class Meta:
+        ordering = ["pk"]
+        verbose_name = _("Job")
+        verbose_name_plural = _("Jobs")
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", _("Queued")
+        RUNNING = "running", _("Running")
+        DONE = "done", _("Done")
+        FAILED = "failed", _("Failed")
+
+    kind = models.CharField(max_length=50)
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.QUEUED, db_index=True
+    )
+    payload = models.JSONField(default=dict, blank=True)
+    file = models.FileField(null=True, blank=True, upload_to="jobs/input/")
+    progress = models.PositiveIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    result_file = models.FileField(null=True, blank=True, upload_to="jobs/output/")
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Job(pk={self.pk}, kind={self.kind!r}, status={self.status})"
+
+
+class DailySales(models.Model):
+    """
+    Выручка магазина за день. Заполняется командой refresh_rollups.
+
+    Пересчёт тут: :mod:`shopapp.rollups`
+    """
+
+    class Meta:
+        ordering = ["date"]
+        verbose_name = _("Daily sales")
+        verbose_name_plural = _("Daily sales")
+
+    date = models.DateField(unique=True)
+    orders_count = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(default=0, max_digits=14, decimal_places=2)
+
+
+class DailyProductSales(models.Model):
+    """
+    Продажи одного товара за день. Заполняется командой refresh_rollups.
+    """
+
+    class Meta:
+        ordering = ["date", "product"]
+        verbose_name = _("Daily product sales")
+        verbose_name_plural = _("Daily product sales")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "product"], name="unique_daily_product_sales"
+            ),
+        ]
+        indexes = [models.Index(fields=["product", "date"])]
+
+    date = models.DateField()
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="daily_sales"
+    )
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(default=0, max_digits=14, decimal_places=2)
+
+
+class RollupWatermark(models.Model):
+    """
+    До какого момента заказы уже учтены в таблицах агрегатов.
+    """
+
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField()
+
+    def __str__(self):
+        return f"RollupWatermark(name={self.name!r}, value={self.value})"
+
+
+class TableCount(models.Model):
+    """
+    Число строк таблицы для пагинации без COUNT(*) в запросе.
+    Обновляется вне запросов, см. shopapp.pagination.refresh_table_counts.
+    """
+
+    table = models.CharField(max_length=100, unique=True)
+    count = models.PositiveBigIntegerField()
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"TableCount(table={self.table!r}, count={self.count})"
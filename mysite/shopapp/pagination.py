@@ -0,0 +1,303 @@
+"""
+Keyset (cursor) пагинация для API магазина.
+
+Страница выбирается условием "строки после последней показанной" по
+полям сортировки, а не OFFSET'ом, и общее количество не считается, поэтому
+стоимость любой страницы одинакова. К сортировке всегда добавляется pk,
+чтобы ключ был уникальным. Курсор непрозрачен для клиента и хранит поля
+сортировки, поэтому курсор от другой сортировки отклоняется. NULL в
+полях сортировки считается больше любого значения, как в PostgreSQL:
+при сортировке по возрастанию такие строки идут последними, по убыванию -
+первыми, и условие "после курсора" сравнивает их так же.
+
+Если клиенту нужно общее количество (?count=1), оно берётся приблизительно:
+для списка без фильтров - из TableCount, который обновляют вне запросов
+команда refresh_row_counts и воркер run_jobs, для отфильтрованного -
+точное, но не больше COUNT_CAP. Тот же подсчёт использует
+EstimatedCountPaginator для списков в админке.
+"""
+
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import EmptyPage, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Model, Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .models import Order, Product, TableCount
+
+COUNT_CAP = 10_000
+TABLE_COUNT_REFRESH_INTERVAL = 60 * 5
+COUNTED_MODELS = (Product, Order)
+
+
+def get_table_count(model: type[Model], refresh: bool = False) -> int:
+    table = model._meta.label_lower
+    if not refresh:
+        count = (
+            TableCount.objects.filter(table=table)
+            .values_list("count", flat=True)
+            .first()
+        )
+        if count is not None:
+            return count
+    # Без refresh сюда попадаем, только пока счётчик ещё ни разу не обновляли
+    count = model._default_manager.count()
+    TableCount.objects.update_or_create(table=table, defaults={"count": count})
+    return count
+
+
+def refresh_table_counts() -> dict[str, int]:
+    return {
+        model._meta.label: get_table_count(model, refresh=True)
+        for model in COUNTED_MODELS
+    }
+
+
+def get_count(queryset: QuerySet, cap: int = COUNT_CAP) -> tuple[int, bool]:
+    """
+    Возвращает (количество, точное ли оно).
+    """
+    if not queryset.query.where:
+        return get_table_count(queryset.model), False
+    count = queryset[: cap + 1].count()
+    if count > cap:
+        return cap, False
+    return count, True
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder обрезает время до миллисекунд, а курсор должен
+    указывать ровно на последнюю показанную строку.
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Оценка может отставать от таблицы или упираться в COUNT_CAP, поэтому
+    для последней по оценке страницы и страниц за ней количество
+    пересчитывается точно.
+    """
+
+    count_exact = False
+
+    @cached_property
+    def count(self) -> int:
+        count, self.count_exact = get_count(self.object_list)
+        return count
+
+    def count_exactly(self) -> None:
+        self.__dict__["count"] = self.object_list.count()
+        self.__dict__.pop("num_pages", None)
+        self.count_exact = True
+
+    def validate_number(self, number) -> int:
+        try:
+            number = super().validate_number(number)
+        except EmptyPage:
+            if self.count_exact:
+                raise
+            self.count_exactly()
+            return super().validate_number(number)
+        if number == self.num_pages and not self.count_exact:
+            self.count_exactly()
+        return number
+
+
+class KeysetPagination(BasePagination):
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering(self, queryset: QuerySet) -> list[str]:
+        ordering = []
+        for name in queryset.query.order_by or queryset.model._meta.ordering:
+            if not isinstance(name, str):
+                continue
+            if (
+                name.lstrip("-") == "pk"
+                or name.lstrip("-") in queryset.query.annotations
+            ):
+                ordering.append(name)
+                continue
+            try:
+                field = queryset.model._meta.get_field(name.lstrip("-"))
+            except FieldDoesNotExist:
+                continue
+            if field.concrete and not field.many_to_many:
+                direction = "-" if name.startswith("-") else ""
+                ordering.append(direction + field.attname)
+        if not {"pk", "-pk", "id", "-id"} & set(ordering):
+            ordering.append("pk")
+        return ordering
+
+    @staticmethod
+    def get_nullable(queryset: QuerySet, ordering: list[str]) -> frozenset[str]:
+        nullable = set()
+        for name in ordering:
+            try:
+                field = queryset.model._meta.get_field(name.lstrip("-"))
+            except FieldDoesNotExist:
+                continue
+            if field.null:
+                nullable.add(field.attname)
+        return frozenset(nullable)
+
+    @staticmethod
+    def order_by(ordering: list[str], nullable: frozenset[str]) -> list:
+        expressions = []
+        for name in ordering:
+            field = name.lstrip("-")
+            if field not in nullable:
+                expressions.append(name)
+            elif name.startswith("-"):
+                expressions.append(F(field).desc(nulls_first=True))
+            else:
+                expressions.append(F(field).asc(nulls_last=True))
+        return expressions
+
+    def encode_cursor(self, values: list, reverse: bool) -> str:
+        data = {"o": self.ordering, "v": values, "r": reverse}
+        raw = json.dumps(data, cls=CursorEncoder).encode()
+        return urlsafe_b64encode(raw).decode()
+
+    def decode_cursor(self, request) -> dict | None:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode()))
+        except (BinasciiError, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (
+            not isinstance(cursor, dict)
+            or cursor.get("o") != self.ordering
+            or len(cursor.get("v") or []) != len(self.ordering)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    @staticmethod
+    def after(
+        ordering: list[str], values: list, nullable: frozenset[str] = frozenset()
+    ) -> Q:
+        """
+        (a, b, c) > (x, y, z) с учётом направления каждого поля:
+        a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        Для полей из nullable NULL больше любого значения, а a = NULL
+        записывается как a IS NULL.
+        """
+        condition = Q()
+        equal = Q()
+        for name, value in zip(ordering, values):
+            field = name.lstrip("-")
+            descending = name.startswith("-")
+            if field not in nullable:
+                lookup = "lt" if descending else "gt"
+                condition |= equal & Q(**{f"{field}__{lookup}": value})
+                equal &= Q(**{field: value})
+                continue
+            if value is None:
+                # После NULL по возрастанию ничего нет, по убыванию - все не NULL
+                if descending:
+                    condition |= equal & Q(**{f"{field}__isnull": False})
+                equal &= Q(**{f"{field}__isnull": True})
+                continue
+            if descending:
+                condition |= equal & Q(**{f"{field}__lt": value})
+            else:
+                condition |= equal & (
+                    Q(**{f"{field}__gt": value}) | Q(**{f"{field}__isnull": True})
+                )
+            equal &= Q(**{field: value})
+        return condition
+
+    @staticmethod
+    def reverse_ordering(ordering: list[str]) -> list[str]:
+        return [name[1:] if name.startswith("-") else f"-{name}" for name in ordering]
+
+    def position(self, obj) -> list:
+        return [getattr(obj, name.lstrip("-")) for name in self.ordering]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(queryset)
+        self.count = self.count_exact = None
+        if request.query_params.get(self.count_query_param) in ("1", "true"):
+            self.count, self.count_exact = get_count(queryset)
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor["r"])
+        ordering = self.reverse_ordering(self.ordering) if reverse else self.ordering
+        nullable = self.get_nullable(queryset, ordering)
+        if cursor:
+            queryset = queryset.filter(self.after(ordering, cursor["v"], nullable))
+        page = list(
+            queryset.order_by(*self.order_by(ordering, nullable))[: page_size + 1]
+        )
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        if reverse:
+            page.reverse()
+        more_after = has_more if not reverse else True
+        more_before = has_more if reverse else cursor is not None
+        self.next_cursor = self.previous_cursor = None
+        if page and more_after:
+            self.next_cursor = self.encode_cursor(self.position(page[-1]), False)
+        if page and more_before:
+            self.previous_cursor = self.encode_cursor(self.position(page[0]), True)
+        return page
+
+    def get_link(self, cursor: str | None) -> str | None:
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        response = {}
+        if self.count is not None:
+            response["count"] = self.count
+            response["count_exact"] = self.count_exact
+        response["next"] = self.get_link(self.next_cursor)
+        response["previous"] = self.get_link(self.previous_cursor)
+        response["results"] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "count": {"type": "integer"},
+                "count_exact": {"type": "boolean"},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
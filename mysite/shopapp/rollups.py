@@ -0,0 +1,91 @@
+"""
+Дневные агрегаты продаж: DailySales и DailyProductSales.
+
+Агрегаты пересчитываются целыми днями, начиная с дня водяного знака
+(последний учтённый created_at заказа), поэтому повторный запуск ничего
+не меняет, а неполный день при следующем запуске досчитывается. Выручка
+за день берётся из Order.total_amount, по товару - из текущей цены товара.
+"""
+
+from datetime import date, datetime, time
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .common import iter_batches
+from .models import DailyProductSales, DailySales, Order, RollupWatermark
+
+WATERMARK = "daily_sales"
+BATCH_SIZE = 1000
+
+
+def get_refresh_start() -> date | None:
+    watermark = RollupWatermark.objects.filter(name=WATERMARK).first()
+    if watermark is not None:
+        return timezone.localdate(watermark.value)
+    first = Order.objects.aggregate(first=Min("created_at"))["first"]
+    return timezone.localdate(first) if first is not None else None
+
+
+def refresh_rollups(since: date | None = None) -> dict:
+    """
+    Пересчитывает агрегаты за дни начиная с since (по умолчанию - с дня
+    водяного знака) и сдвигает водяной знак.
+    """
+    since = since or get_refresh_start()
+    if since is None:
+        return {"since": None, "days": 0, "product_days": 0}
+    start = timezone.make_aware(datetime.combine(since, time.min))
+    orders = Order.objects.filter(created_at__gte=start)
+    daily = (
+        orders.annotate(day=TruncDate("created_at"))
+        .order_by()
+        .values("day")
+        .annotate(
+            orders_count=Count("pk"),
+            units=Sum("products_count"),
+            revenue=Sum("total_amount"),
+        )
+    )
+    per_product = (
+        Order.products.through.objects.filter(order__created_at__gte=start)
+        .annotate(day=TruncDate("order__created_at"))
+        .order_by()
+        .values("day", "product_id")
+        .annotate(units=Count("pk"), revenue=Sum("product__price"))
+    )
+    with transaction.atomic():
+        last = orders.aggregate(last=Max("created_at"))["last"]
+        DailySales.objects.filter(date__gte=since).delete()
+        DailyProductSales.objects.filter(date__gte=since).delete()
+        days = DailySales.objects.bulk_create(
+            DailySales(
+                date=row["day"],
+                orders_count=row["orders_count"],
+                units=row["units"],
+                revenue=row["revenue"],
+            )
+            for row in daily
+        )
+        product_days = 0
+        for batch in iter_batches(per_product.iterator(), BATCH_SIZE):
+            DailyProductSales.objects.bulk_create(
+                DailyProductSales(
+                    date=row["day"],
+                    product_id=row["product_id"],
+                    units=row["units"],
+                    revenue=row["revenue"],
+                )
+                for row in batch
+            )
+            product_days += len(batch)
+        if last is not None:
+            watermark, created = RollupWatermark.objects.get_or_create(
+                name=WATERMARK, defaults={"value": last}
+            )
+            if not created and watermark.value < last:
+                watermark.value = last
+                watermark.save(update_fields=["value"])
+    return {"since": since, "days": len(days), "product_days": product_days}
@@ -0,0 +1,142 @@
+"""
+Полнотекстовый поиск товаров.
+
+На SQLite для товаров ведётся FTS5 таблица shopapp_product_fts по полям
+name и description (миграция 0019). Она хранит только индекс, а текст
+берёт из shopapp_product, и обновляется триггерами, поэтому в синхронизации
+участвуют и bulk_create, и update(), и сырой SQL. Результаты сортируются
+по bm25 - чем меньше, тем релевантнее. Запросы соединяют товары с
+таблицей через модель ProductSearchIndex.
+
+SQLite меняет столбцы пересозданием таблицы (_remake_table), и триггеры
+shopapp_product при этом пропадают. После каждой миграции
+restore_fts_triggers создаёт недостающие и перестраивает индекс.
+
+На других СУБД поиск откатывается к обычному icontains SearchFilter.
+"""
+
+import logging
+import re
+
+from django.db import connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.models import F, QuerySet
+from rest_framework.filters import SearchFilter
+
+log = logging.getLogger(__name__)
+
+PRODUCT_FTS_TABLE = "shopapp_product_fts"
+
+# Те же триггеры, что в миграции 0019, но без ошибки, если триггер уже есть
+PRODUCT_FTS_TRIGGERS = {
+    "shopapp_product_fts_insert": """
+    CREATE TRIGGER IF NOT EXISTS shopapp_product_fts_insert
+    AFTER INSERT ON shopapp_product
+    BEGIN
+        INSERT INTO shopapp_product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "shopapp_product_fts_delete": """
+    CREATE TRIGGER IF NOT EXISTS shopapp_product_fts_delete
+    AFTER DELETE ON shopapp_product
+    BEGIN
+        INSERT INTO shopapp_product_fts(shopapp_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    "shopapp_product_fts_update": """
+    CREATE TRIGGER IF NOT EXISTS shopapp_product_fts_update
+    AFTER UPDATE OF name, description ON shopapp_product
+    BEGIN
+        INSERT INTO shopapp_product_fts(shopapp_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO shopapp_product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+}
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def fts_enabled(queryset: QuerySet) -> bool:
+    return connections[queryset.db].vendor == "sqlite"
+
+
+def restore_fts_triggers(connection: BaseDatabaseWrapper) -> list[str]:
+    """
+    Создаёт пропавшие триггеры FTS таблицы и перестраивает индекс,
+    если какого-то не было: изменения без триггера в него не попали.
+    Возвращает имена созданных триггеров.
+    """
+    if connection.vendor != "sqlite":
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT type, name FROM sqlite_master WHERE name LIKE %s",
+            [f"{PRODUCT_FTS_TABLE}%"],
+        )
+        existing = {name for _, name in cursor.fetchall()}
+        if PRODUCT_FTS_TABLE not in existing:
+            # Миграция 0019 ещё не применена или откачена
+            return []
+        missing = [name for name in PRODUCT_FTS_TRIGGERS if name not in existing]
+        if not missing:
+            return []
+        for name in missing:
+            cursor.execute(PRODUCT_FTS_TRIGGERS[name])
+        cursor.execute(
+            f"INSERT INTO {PRODUCT_FTS_TABLE}({PRODUCT_FTS_TABLE}) VALUES ('rebuild')"
+        )
+    log.warning("Restored product search triggers: %s", ", ".join(missing))
+    return missing
+
+
+def build_match_query(text: str) -> str:
+    """
+    Строка поиска -> запрос MATCH: все слова обязательны, последнее
+    ищется как префикс (его обычно ещё допечатывают). Слова берутся
+    в кавычки, чтобы операторы FTS5 из ввода не работали.
+    """
+    tokens = [f'"{token}"' for token in TOKEN_RE.findall(text)]
+    if tokens:
+        tokens[-1] += "*"
+    return " ".join(tokens)
+
+
+def search_products(queryset: QuerySet, text: str) -> QuerySet:
+    """
+    Фильтрует товары по FTS индексу и сортирует по релевантности.
+    Ранг доступен в поле search_rank.
+    """
+    match = build_match_query(text)
+    if not match:
+        return queryset
+    # Ранг берём из JOIN: подзапрос с MATCH на каждую строку на частых
+    # словах в сотни раз медленнее
+    return (
+        queryset.filter(search_index__match=match)
+        .annotate(search_rank=F("search_index__rank"))
+        .order_by("search_rank", "pk")
+    )
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    SearchFilter для товаров через FTS5 индекс.
+    Явная сортировка (?ordering=) применяется поверх ранга.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if not fts_enabled(queryset):
+            return super().filter_queryset(request, queryset, view)
+        text = " ".join(self.get_search_terms(request))
+        return search_products(queryset, text)
+
+
+class ProductSearchAdminMixin:
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not fts_enabled(queryset):
+            return super().get_search_results(request, queryset, search_term)
+        return search_products(queryset, search_term), False
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Product, Order
+from .models import Product, Order, Job, DailySales, DailyProductSales
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -26,4 +26,36 @@ class OrderSerializer(serializers.ModelSerializer):
             "created_at",
             "products",
             "user",
+            "products_count",
+            "total_amount",
         ]
+        read_only_fields = ["products_count", "total_amount"]
+
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = (
+            "pk",
+            "kind",
+            "status",
+            "progress",
+            "result",
+            "result_file",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+        )
+
+
+class DailySalesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailySales
+        fields = ("date", "orders_count", "units", "revenue")
+
+
+class DailyProductSalesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailyProductSales
+        fields = ("date", "product", "units", "revenue")
@@ -0,0 +1,158 @@
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.db.models import Sum
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_migrate,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from .autocomplete import product_name_index
+from .cache import ORDERS, PRODUCTS, bump_user_orders, bump_version
+from .models import Order, Product, ProductImage, clear_deleted_user_cache
+from .search import restore_fts_triggers
+
+# Сколько товаров за раз прибавлять к итогам заказа без пересчёта
+INCREMENTAL_TOTALS_LIMIT = 500
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def product_changed(sender, **kwargs):
+    bump_version(PRODUCTS)
+
+
+@receiver(post_save, sender=Product)
+def product_saved_index(sender, instance: Product, **kwargs):
+    transaction.on_commit(lambda: product_name_index.update(instance))
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted_index(sender, instance: Product, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: product_name_index.remove(pk))
+
+
+@receiver(post_delete, sender=User)
+def deleted_user_removed(sender, **kwargs):
+    # Удаление пользователей редкое, проще сбросить кэш при любом
+    clear_deleted_user_cache()
+
+
+@receiver(post_migrate)
+def deleted_user_flushed(sender, **kwargs):
+    # flush в TransactionTestCase удаляет строки без post_delete
+    clear_deleted_user_cache()
+
+
+@receiver(post_migrate)
+def product_search_migrated(sender, using, **kwargs):
+    if sender.label == "shopapp" and restore_fts_triggers(connections[using]):
+        # После перестроения индекса результаты поиска могли измениться
+        bump_version(PRODUCTS)
+
+
+def product_price(product: Product):
+    # До full_clean цена может быть строкой из формы или API
+    return Product._meta.get_field("price").to_python(product.price)
+
+
+@receiver(pre_save, sender=Product)
+def product_price_loaded(sender, instance: Product, **kwargs):
+    instance._previous_price = None
+    if instance.pk is not None and not instance._state.adding:
+        instance._previous_price = (
+            Product.objects.filter(pk=instance.pk)
+            .values_list("price", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Product)
+def product_price_changed(sender, instance: Product, created, **kwargs):
+    previous = getattr(instance, "_previous_price", None)
+    price = product_price(instance)
+    if created or previous is None or previous == price:
+        return
+    Order.objects.filter(products=instance).add_to_totals(price - previous, 0)
+
+
+@receiver(pre_delete, sender=Product)
+def product_removed_from_orders(sender, instance: Product, **kwargs):
+    # Строки промежуточной таблицы удалятся каскадом без m2m_changed
+    price = product_price(instance)
+    Order.objects.filter(products=instance).add_to_totals(-price, -1)
+
+
+@receiver(pre_save, sender=Order)
+def order_owner_changed(sender, instance: Order, **kwargs):
+    if instance.pk is None:
+        return
+    previous = (
+        Order.objects.filter(pk=instance.pk).values_list("user_id", flat=True).first()
+    )
+    if previous is not None and previous != instance.user_id:
+        bump_user_orders(previous)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def order_changed(sender, instance: Order, **kwargs):
+    bump_version(ORDERS)
+    bump_user_orders(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def order_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            bump_version(ORDERS)
+            bump_user_orders(instance.user_id)
+        return
+    # instance - товар, pk_set - id заказов
+    if action == "pre_clear":
+        orders = instance.orders.all()
+    elif action in ("post_add", "post_remove"):
+        orders = Order.objects.filter(pk__in=pk_set)
+    else:
+        return
+    bump_version(ORDERS)
+    bump_user_orders(*orders.values_list("user_id", flat=True))
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def order_totals_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Поддерживает Order.total_amount и products_count. При добавлении
+    прибавляем цены добавленных товаров, при удалении пересчитываем
+    заказ целиком: в pk_set могут быть товары, которых в заказе не было.
+    Большие добавления (Order.set_products_bulk) тоже пересчитываем:
+    pk_set не влезет в параметры одного запроса.
+    """
+    if not reverse:
+        orders = Order.objects.filter(pk=instance.pk)
+        if action == "post_add" and len(pk_set) > INCREMENTAL_TOTALS_LIMIT:
+            orders.recompute_totals()
+        elif action == "post_add":
+            products = Product.objects.filter(pk__in=pk_set)
+            amount = products.aggregate(total=Sum("price", default=0))["total"]
+            orders.add_to_totals(amount, len(pk_set))
+        elif action == "post_remove":
+            orders.recompute_totals()
+        elif action == "post_clear":
+            orders.update(total_amount=0, products_count=0)
+        return
+    # instance - товар, pk_set - id заказов
+    if action == "post_add":
+        Order.objects.filter(pk__in=pk_set).add_to_totals(product_price(instance), 1)
+    elif action == "post_remove":
+        Order.objects.filter(pk__in=pk_set).recompute_totals()
+    elif action == "pre_clear":
+        price = product_price(instance)
+        Order.objects.filter(products=instance).add_to_totals(-price, -1)
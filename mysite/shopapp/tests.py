@@ -1,10 +1,47 @@
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from tempfile import NamedTemporaryFile, gettempdir
+
 from django.contrib.auth.models import User, Permission
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.core.paginator import EmptyPage
+from django.db import DatabaseError, connection, transaction
+from django.db.models.signals import m2m_changed
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone, translation
 from string import ascii_letters
 from random import choices
 from django.conf import settings
-from shopapp.models import Product, Order
+from shopapp.autocomplete import ProductNameIndex, product_name_index
+from shopapp.cache import PRODUCTS, get_versions, user_orders_export_key
+from shopapp.common import save_csv_products
+from shopapp.csv_parallel import parse_csv_products_parallel
+from shopapp.jobs import claim_job, heartbeat, recover_stale_jobs, run_pending_jobs
+from shopapp.models import (
+    DELETED_USERNAME,
+    DailyProductSales,
+    DailySales,
+    Job,
+    Order,
+    Product,
+    clear_deleted_user_cache,
+    get_deleted_user,
+)
+from shopapp.pagination import (
+    EstimatedCountPaginator,
+    get_count,
+    get_table_count,
+    refresh_table_counts,
+)
+from shopapp.rollups import refresh_rollups
 from shopapp.utils import add_two_numbers
 
 
@@ -135,6 +172,43 @@ class ProductExportViewTestCase(TestCase):
         self.assertEqual(products_data["products"], expected_data)
 
 
+class ProductExportStreamingTestCase(TestCase):
+    fixtures = [
+        "products-fixture.json",
+    ]
+
+    def test_ndjson_export(self):
+        response = self.client.get(
+            reverse("shopapp:products-export"), {"format": "ndjson"}
+        )
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        products = [json.loads(line) for line in lines]
+        self.assertEqual(
+            [product["pk"] for product in products],
+            list(Product.objects.order_by("pk").values_list("pk", flat=True)),
+        )
+        self.assertEqual(products[0]["price"], "1999.00")
+
+    def test_keyset_pages_cover_all_products(self):
+        pks = []
+        after = 0
+        while after is not None:
+            response = self.client.get(
+                reverse("shopapp:products-export"), {"after": after, "limit": 3}
+            )
+            data = response.json()
+            pks.extend(product["pk"] for product in data["products"])
+            after = data["next"]
+        self.assertEqual(
+            pks, list(Product.objects.order_by("pk").values_list("pk", flat=True))
+        )
+
+    def test_keyset_rejects_bad_cursor(self):
+        response = self.client.get(reverse("shopapp:products-export"), {"after": "x"})
+        self.assertEqual(response.status_code, 400)
+
+
 class OrderDetailViewTestCase(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -163,37 +237,906 @@ class OrderDetailViewTestCase(TestCase):
 
 class OrderExportTestCase(TestCase):
     fixtures = [
-        "orders-fixture.json",
+        "products-fixture.json",
     ]
 
     @classmethod
-    def setUpClass(cls):
+    def setUpTestData(cls):
         cls.user = User.objects.create_user(username="bill", password="qwerty")
         cls.user.is_staff = True
         cls.user.save()
+        customer = User.objects.create_user(username="jane", password="qwerty")
+        cls.order = Order.objects.create(
+            user=customer, delivery_address="ul.Pupkina, d 8 ", promocode="SALE123"
+        )
+        cls.order.products.set([3, 1, 2])
+        Order.objects.create(user=cls.user, delivery_address="lomonosova 3")
 
     def setUp(self):
         self.client.force_login(self.user)
 
-    @classmethod
-    def tearDownClass(cls):
-        cls.user.delete()
+    def get_export(self, **params) -> bytes:
+        response = self.client.get(reverse("shopapp:orders-export"), params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
 
     def test_get_order_list(self):
-        response = self.client.get(
-            reverse("shopapp:orders-export"),
-        )
-        self.assertEqual(response.status_code, 200)
         orders = Order.objects.order_by("pk").all()
         expected_data = [
             {
                 "id": order.id,
                 "address": order.delivery_address,
                 "promocode": order.promocode,
-                "user": order.user,
-                "products": order.products,
+                "user": order.user.username,
+                "products": sorted(order.products.values_list("pk", flat=True)),
+                "products_count": order.products_count,
+                "total_amount": str(order.total_amount),
             }
             for order in orders
         ]
-        orders_data = response.json()
+        orders_data = json.loads(self.get_export())
+        self.assertTrue(expected_data)
         self.assertEqual(orders_data["orders"], expected_data)
+
+    def test_get_order_list_csv(self):
+        lines = self.get_export(format="csv").decode().splitlines()
+        self.assertEqual(
+            lines[0], "id,address,promocode,user,products,products_count,total_amount"
+        )
+        self.assertEqual(
+            lines[1],
+            f'{self.order.pk},"ul.Pupkina, d 8 ",SALE123,jane,1 2 3,3,4598.00',
+        )
+
+    def test_query_count_does_not_depend_on_orders(self):
+        with CaptureQueriesContext(connection) as few:
+            self.get_export()
+        products = list(Product.objects.all())
+        for i in range(20):
+            order = Order.objects.create(user=self.user, promocode=f"p{i}")
+            order.products.set(products)
+        with CaptureQueriesContext(connection) as many:
+            self.get_export()
+        self.assertEqual(len(few), len(many))
+
+
+class UserOrdersExportCacheTestCase(TestCase):
+    fixtures = [
+        "products-fixture.json",
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username="alice", password="qwerty")
+        cls.bob = User.objects.create_user(username="bob", password="qwerty")
+        Order.objects.create(user=cls.alice, promocode="A1")
+        Order.objects.create(user=cls.bob, promocode="B1")
+
+    def setUp(self):
+        cache.clear()
+
+    def get_orders(self, user: User) -> list:
+        response = self.client.get(
+            reverse("shopapp:user-orders-export", kwargs={"user_id": user.pk})
+        )
+        return response.json()["orders"]
+
+    def test_cache_is_per_user(self):
+        self.assertEqual(self.get_orders(self.alice)[0]["promocode"], "A1")
+        self.assertEqual(self.get_orders(self.bob)[0]["promocode"], "B1")
+
+    def test_new_order_invalidates_only_owner(self):
+        self.get_orders(self.alice)
+        self.get_orders(self.bob)
+        bob_key = user_orders_export_key(self.bob.pk)
+        order = Order.objects.create(user=self.alice, promocode="A2")
+        self.assertEqual(len(self.get_orders(self.alice)), 2)
+        self.assertEqual(user_orders_export_key(self.bob.pk), bob_key)
+        with self.assertNumQueries(1):
+            self.get_orders(self.bob)
+
+        order.products.add(1)
+        self.assertEqual(self.get_orders(self.alice)[-1]["products"], [1])
+        Product.objects.get(pk=1).orders.remove(order)
+        self.assertEqual(self.get_orders(self.alice)[-1]["products"], [])
+        order.delete()
+        self.assertEqual(len(self.get_orders(self.alice)), 1)
+
+
+class CatalogCacheInvalidationTestCase(TestCase):
+    fixtures = [
+        "products-fixture.json",
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.enterContext(translation.override("en"))
+
+    def get_export(self) -> dict:
+        response = self.client.get(reverse("shopapp:products-export"))
+        return {product["pk"]: product for product in response.json()["products"]}
+
+    def test_export_is_cached(self):
+        self.get_export()
+        with self.assertNumQueries(0):
+            self.get_export()
+
+    def test_save_invalidates_export(self):
+        self.get_export()
+        product = Product.objects.get(pk=1)
+        product.price = "1.00"
+        product.save()
+        self.assertEqual(self.get_export()[1]["price"], "1.00")
+
+    def test_bulk_update_invalidates_export(self):
+        self.get_export()
+        Product.objects.filter(pk=1).update(archived=True)
+        self.assertTrue(self.get_export()[1]["archived"])
+
+    def test_rolled_back_write_is_not_cached(self):
+        self.get_export()
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            Product.objects.filter(pk=1).update(name="Uncommitted")
+            self.assertEqual(self.get_export()[1]["name"], "Uncommitted")
+            raise DatabaseError
+        self.assertNotEqual(self.get_export()[1]["name"], "Uncommitted")
+
+    def test_version_is_bumped_on_commit(self):
+        versions = get_versions(PRODUCTS)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=1).update(archived=True)
+            self.assertEqual(get_versions(PRODUCTS), versions)
+        self.assertNotEqual(get_versions(PRODUCTS), versions)
+
+    def test_api_list_is_invalidated(self):
+        url = reverse("shopapp:product-list")
+        self.client.get(url, HTTP_ACCEPT="application/json")
+        Product.objects.filter(pk=1).update(name="Renamed")
+        response = self.client.get(url, HTTP_ACCEPT="application/json")
+        self.assertIn("Renamed", [p["name"] for p in response.json()["results"]])
+
+
+class ProductListCacheTestCase(TestCase):
+    fixtures = [
+        "products-fixture.json",
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.enterContext(translation.override("en"))
+        self.url = reverse("shopapp:product-list")
+
+    def get_list(self, query: str = "") -> dict:
+        response = self.client.get(self.url + query, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_normalized_params_share_entry(self):
+        first = self.get_list("?search=top&ordering=price&utm=1")
+        with self.assertNumQueries(0):
+            second = self.get_list("?ordering=price&search=top")
+        self.assertEqual(first, second)
+
+    def test_different_filters_are_cached_separately(self):
+        archived = self.get_list("?archived=true")
+        active = self.get_list("?archived=false")
+        self.assertNotEqual(archived["results"], active["results"])
+
+    def test_cache_stats(self):
+        self.get_list()
+        self.get_list()
+        admin = User.objects.create_superuser(username="root", password="qwerty")
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse("shopapp:product-cache-stats"), HTTP_ACCEPT="application/json"
+        )
+        self.assertEqual(response.json()["hits"], 1)
+        self.assertEqual(response.json()["misses"], 1)
+
+
+class ProductDownloadCSVTestCase(TestCase):
+    fixtures = [
+        "products-fixture.json",
+    ]
+
+    def test_download_csv_streams_rows(self):
+        response = self.client.get(reverse("shopapp:product-download-csv"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "name,description,price,discount")
+        self.assertEqual(len(lines) - 1, Product.objects.count())
+
+    def test_download_csv_applies_search(self):
+        response = self.client.get(
+            reverse("shopapp:product-download-csv"), {"search": "Laptop"}
+        )
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[1:], ["Laptop,,1999.00,0"])
+
+
+@override_settings(MEDIA_ROOT=gettempdir())
+class ProductUploadCSVTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username="uploader", password="qwerty")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def upload(self, content: str, query: str = "") -> dict:
+        file = SimpleUploadedFile("products.csv", content.encode(), "text/csv")
+        response = self.client.post(
+            reverse("shopapp:product-upload-csv") + query, {"file": file}
+        )
+        self.assertEqual(response.status_code, 202)
+        job = Job.objects.get(pk=response.json()["job"])
+        self.assertTrue(default_storage.exists(job.file.name))
+        self.assertEqual(run_pending_jobs(), 1)
+        self.assertFalse(default_storage.exists(job.file.name))
+        job.refresh_from_db()
+        self.assertFalse(job.file)
+        self.assertEqual(job.status, Job.Status.DONE)
+        return job.result
+
+    def test_upload_csv_in_batches(self):
+        rows = "".join(f"Item{i},desc,{i}.50,{i % 10}\n" for i in range(25))
+        with self.settings(CSV_IMPORT_BATCH_SIZE=10):
+            report = self.upload("name,description,price,discount\n" + rows)
+        self.assertEqual(report["created"], 25)
+        self.assertEqual(Product.objects.filter(name__startswith="Item").count(), 25)
+
+    def test_upload_csv_reports_invalid_rows(self):
+        report = self.upload(
+            "name,description,price,discount\n"
+            "Good,desc,10.00,5\n"
+            "Bad,desc,not-a-price,5\n"
+            ",desc,1.00,abc\n"
+        )
+        self.assertEqual(report["created"], 1)
+        self.assertEqual(report["failed"], 2)
+        self.assertEqual(report["errors"][0]["line"], 3)
+        self.assertIn("price", report["errors"][0]["errors"])
+        self.assertEqual(set(report["errors"][1]["errors"]), {"name", "discount"})
+
+    def test_upload_csv_upsert_by_sku(self):
+        Product.objects.create(sku="A-1", name="Old", price="1.00")
+        Product.objects.create(sku="A-2", name="Same", price="2.00")
+        report = self.upload(
+            "sku,name,price\nA-1,New,1.50\nA-2,Same,2.00\nA-3,Fresh,3.00\n",
+            query="?mode=upsert",
+        )
+        self.assertEqual(
+            (report["created"], report["updated"], report["unchanged"]), (1, 1, 1)
+        )
+        self.assertEqual(Product.objects.get(sku="A-1").name, "New")
+        self.assertEqual(Product.objects.filter(sku__startswith="A-").count(), 3)
+
+    def test_export_csv_job(self):
+        Product.objects.create(name="Exported", price="5.00")
+        response = self.client.post(
+            reverse("shopapp:product-export-csv") + "?search=Exported"
+        )
+        self.assertEqual(response.status_code, 202)
+        run_pending_jobs()
+        response = self.client.get(response.json()["status_url"])
+        self.assertEqual(response.json()["status"], "done")
+        self.assertEqual(response.json()["result"]["rows"], 1)
+        job = Job.objects.get(pk=response.json()["pk"])
+        with job.result_file.open("rb") as file:
+            self.assertIn(b"Exported,,5.00,0", file.read())
+        job.result_file.delete()
+
+    def test_jobs_are_visible_only_to_owner(self):
+        other = User.objects.create_user(username="other", password="qwerty")
+        job = Job.objects.create(kind="export_products_csv", created_by=other)
+        response = self.client.get(reverse("shopapp:job-detail", kwargs={"pk": job.pk}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_anonymous_cannot_enqueue_jobs(self):
+        self.enterContext(translation.override("en"))
+        self.client.logout()
+        response = self.client.post(reverse("shopapp:product-export-csv"))
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Job.objects.exists())
+
+    def test_stale_running_jobs_are_recovered(self):
+        stale_at = timezone.now() - timedelta(hours=1)
+        retried = Job.objects.create(
+            kind="export_products_csv", status=Job.Status.RUNNING, attempts=1
+        )
+        exhausted = Job.objects.create(
+            kind="export_products_csv", status=Job.Status.RUNNING, attempts=3
+        )
+        alive = Job.objects.create(
+            kind="export_products_csv", status=Job.Status.RUNNING, attempts=1
+        )
+        partial = Job.objects.create(
+            kind="import_products_csv",
+            status=Job.Status.RUNNING,
+            attempts=1,
+            progress=500,
+            file=SimpleUploadedFile("products.csv", b"name\n"),
+        )
+        Job.objects.exclude(pk=alive.pk).update(heartbeat_at=stale_at)
+        heartbeat(alive.pk)
+        self.assertEqual(recover_stale_jobs(), (1, 2))
+        statuses = dict(Job.objects.values_list("pk", "status"))
+        self.assertEqual(statuses[retried.pk], Job.Status.QUEUED)
+        self.assertEqual(statuses[exhausted.pk], Job.Status.FAILED)
+        self.assertEqual(statuses[partial.pk], Job.Status.FAILED)
+        self.assertFalse(default_storage.exists(partial.file.name))
+        partial.refresh_from_db()
+        self.assertEqual((partial.progress, partial.file.name), (500, ""))
+        self.assertEqual(statuses[alive.pk], Job.Status.RUNNING)
+        self.assertEqual(claim_job().attempts, 2)
+
+
+class ParallelCSVParseTestCase(TestCase):
+    def setUp(self):
+        self.file = NamedTemporaryFile("w", suffix=".csv")
+        self.file.write("name,price,discount\n")
+        self.file.writelines(f"Item{i},{i}.25,{i % 10}\n" for i in range(300))
+        self.file.write("Broken,oops,1\n")
+        self.file.flush()
+
+    def tearDown(self):
+        self.file.close()
+
+    def test_parallel_parse_keeps_file_order_and_line_numbers(self):
+        fieldnames, rows = parse_csv_products_parallel(
+            self.file.name, "utf-8", workers=2, chunk_size=512
+        )
+        rows = list(rows)
+        self.assertEqual(fieldnames, ["name", "price", "discount"])
+        self.assertEqual([line for line, data, errors in rows], list(range(2, 303)))
+        self.assertEqual(rows[10][1]["name"], "Item10")
+        self.assertIn("price", rows[-1][2])
+
+    def test_save_csv_products_with_workers(self):
+        with open(self.file.name, "rb") as file:
+            report = save_csv_products(file, encoding="utf-8", workers=2)
+        self.assertEqual((report.created, report.failed), (300, 1))
+        self.assertEqual(report.errors[0]["line"], 302)
+
+
+class DeletedUserCacheTestCase(TestCase):
+    def setUp(self):
+        # Кэш переживает откат TestCase, сбрасываем его сами
+        self.addCleanup(clear_deleted_user_cache)
+
+    def import_queries(self, rows: int) -> int:
+        content = "name,price\n" + "".join(f"Item{i},1.00\n" for i in range(rows))
+        with CaptureQueriesContext(connection) as queries:
+            save_csv_products(BytesIO(content.encode()), encoding="utf-8")
+        return len(queries)
+
+    def test_pk_is_remembered_after_commit(self):
+        pk = get_deleted_user()
+        # До коммита pk запоминается только для текущей транзакции
+        with self.assertNumQueries(0):
+            self.assertEqual(get_deleted_user(), pk)
+        self.assertEqual(self.import_queries(5), self.import_queries(50))
+        with self.captureOnCommitCallbacks(execute=True):
+            get_deleted_user()
+        with self.assertNumQueries(0):
+            self.assertEqual(Product(name="Orphan").created_by_id, pk)
+        self.assertEqual(self.import_queries(5), self.import_queries(50))
+
+    def test_pk_is_forgotten_on_rollback(self):
+        try:
+            with transaction.atomic():
+                pk = get_deleted_user()
+                raise DatabaseError
+        except DatabaseError:
+            pass
+        # Пользователь создаётся заново, его pk может совпасть со старым
+        with CaptureQueriesContext(connection) as queries:
+            pk = get_deleted_user()
+        self.assertTrue(queries)
+        self.assertEqual(User.objects.get(username=DELETED_USERNAME).pk, pk)
+
+    def test_cache_is_cleared_when_user_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            pk = get_deleted_user()
+        User.objects.filter(pk=pk).delete()
+        self.assertNotEqual(get_deleted_user(), pk)
+        self.assertTrue(User.objects.filter(username=DELETED_USERNAME).exists())
+
+
+class KeysetPaginationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Product.objects.bulk_create(
+            Product(name=f"Item {i % 7}", price=i % 3, created_by=None)
+            for i in range(45)
+        )
+
+    def setUp(self):
+        self.enterContext(translation.override("en"))
+
+    def walk(self, url: str, key: str = "next") -> list[int]:
+        pks = []
+        while url:
+            response = self.client.get(url, HTTP_ACCEPT="application/json")
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertNotIn("count", data)
+            pks.extend(product["pk"] for product in data["results"])
+            url = data[key]
+        return pks
+
+    def test_walk_forward_matches_ordering(self):
+        expected = list(
+            Product.objects.order_by("name", "price", "pk").values_list("pk", flat=True)
+        )
+        self.assertEqual(self.walk(reverse("shopapp:product-list")), expected)
+
+    def test_walk_with_custom_ordering(self):
+        expected = list(
+            Product.objects.order_by("-price", "pk").values_list("pk", flat=True)
+        )
+        url = reverse("shopapp:product-list") + "?ordering=-price&page_size=4"
+        self.assertEqual(self.walk(url), expected)
+
+    def test_previous_link_returns_previous_page(self):
+        url = reverse("shopapp:product-list")
+        first = self.client.get(url, HTTP_ACCEPT="application/json").json()
+        second = self.client.get(first["next"], HTTP_ACCEPT="application/json").json()
+        back = self.client.get(second["previous"], HTTP_ACCEPT="application/json")
+        self.assertEqual(back.json()["results"], first["results"])
+        self.assertIsNone(back.json()["previous"])
+
+    def test_walk_orders_by_created_at_with_microseconds(self):
+        user = User.objects.create_user(username="buyer")
+        start = timezone.now().replace(microsecond=0)
+        for i in range(25):
+            order = Order.objects.create(user=user, promocode=str(i))
+            # Несколько заказов в одной миллисекунде, в обратном порядке pk
+            Order.objects.filter(pk=order.pk).update(
+                created_at=start + timedelta(microseconds=999 - i * 37)
+            )
+        expected = [str(i) for i in reversed(range(25))]
+        url = reverse("shopapp:order-list") + "?page_size=2"
+        promocodes = []
+        while url:
+            data = self.client.get(url, HTTP_ACCEPT="application/json").json()
+            promocodes.extend(order["promocode"] for order in data["results"])
+            last_url, url = url, data["next"]
+        self.assertEqual(promocodes, expected)
+        url = self.client.get(last_url, HTTP_ACCEPT="application/json").json()[
+            "previous"
+        ]
+        backwards = []
+        while url:
+            data = self.client.get(url, HTTP_ACCEPT="application/json").json()
+            backwards[:0] = [order["promocode"] for order in data["results"]]
+            url = data["previous"]
+        self.assertEqual(backwards, expected[:-1])
+
+    def test_walk_across_null_values(self):
+        user = User.objects.create_user(username="buyer")
+        for promocode, address in [("1", "b"), ("2", None), ("3", "a"), ("4", None)]:
+            Order.objects.create(
+                user=user, promocode=promocode, delivery_address=address
+            )
+        url = reverse("shopapp:order-list")
+        for ordering, expected in [
+            ("delivery_address", ["3", "1", "2", "4"]),
+            ("-delivery_address", ["2", "4", "1", "3"]),
+        ]:
+            with self.subTest(ordering=ordering):
+                page_url = f"{url}?ordering={ordering}&page_size=1"
+                promocodes = []
+                while page_url:
+                    response = self.client.get(page_url, HTTP_ACCEPT="application/json")
+                    self.assertEqual(response.status_code, 200)
+                    data = response.json()
+                    promocodes.extend(order["promocode"] for order in data["results"])
+                    last_url, page_url = page_url, data["next"]
+                self.assertEqual(promocodes, expected)
+                previous = self.client.get(
+                    last_url, HTTP_ACCEPT="application/json"
+                ).json()["previous"]
+                response = self.client.get(previous, HTTP_ACCEPT="application/json")
+                self.assertEqual(
+                    [order["promocode"] for order in response.json()["results"]],
+                    expected[-2:-1],
+                )
+
+    def test_cursor_from_other_ordering_is_rejected(self):
+        url = reverse("shopapp:product-list")
+        first = self.client.get(url, HTTP_ACCEPT="application/json").json()
+        response = self.client.get(
+            first["next"] + "&ordering=discount", HTTP_ACCEPT="application/json"
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class ApproximateCountTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Product.objects.bulk_create(
+            Product(name=f"Item {i}", price=i % 3, created_by=None) for i in range(12)
+        )
+
+    def setUp(self):
+        self.enterContext(translation.override("en"))
+        cache.clear()
+
+    def test_unfiltered_count_is_cached(self):
+        self.assertEqual(get_count(Product.objects.all()), (12, False))
+        Product.objects.create(name="New", created_by=None)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_count(Product.objects.order_by("pk")), (12, False))
+        self.assertEqual(refresh_table_counts()["shopapp.Product"], 13)
+        self.assertEqual(get_count(Product.objects.all()), (13, False))
+
+    def test_admin_pages_past_stale_estimate(self):
+        get_table_count(Product)
+        Product.objects.bulk_create(
+            Product(name=f"More {i}", created_by=None) for i in range(10)
+        )
+        paginator = EstimatedCountPaginator(Product.objects.order_by("pk"), 10)
+        self.assertEqual(paginator.num_pages, 2)
+        self.assertEqual(len(paginator.page(2)), 10)
+        self.assertEqual(paginator.num_pages, 3)
+        paginator = EstimatedCountPaginator(Product.objects.order_by("pk"), 10)
+        self.assertEqual(len(paginator.page(3)), 2)
+        with self.assertRaises(EmptyPage):
+            paginator.page(4)
+
+    def test_filtered_count_is_capped(self):
+        queryset = Product.objects.filter(price=0)
+        self.assertEqual(get_count(queryset), (4, True))
+        self.assertEqual(get_count(queryset, cap=3), (3, False))
+
+    def test_api_returns_count_on_request(self):
+        url = reverse("shopapp:product-list")
+        data = self.client.get(
+            url + "?count=1&price=1", HTTP_ACCEPT="application/json"
+        ).json()
+        self.assertEqual(data["count"], 4)
+        self.assertTrue(data["count_exact"])
+        data = self.client.get(url, HTTP_ACCEPT="application/json").json()
+        self.assertNotIn("count", data)
+
+
+class ProductFullTextSearchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.pie = Product.objects.create(
+            name="Apple pie", description="Red apple, apple jam", created_by=None
+        )
+        cls.apple = Product.objects.create(
+            name="Apple", description="Fresh", created_by=None
+        )
+        Product.objects.bulk_create(
+            [
+                Product(name="Pear", description="Green", created_by=None),
+                Product(name="Café crème", description="", created_by=None),
+            ]
+        )
+
+    def setUp(self):
+        self.enterContext(translation.override("en"))
+
+    def search(self, text: str) -> list[str]:
+        response = self.client.get(
+            reverse("shopapp:product-list"),
+            {"search": text},
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        return [product["name"] for product in response.json()["results"]]
+
+    def test_results_ranked_by_relevance(self):
+        self.assertEqual(self.search("apple"), ["Apple pie", "Apple"])
+
+    def test_prefix_and_diacritics(self):
+        self.assertEqual(self.search("cafe crè"), ["Café crème"])
+        self.assertEqual(self.search('gre"*'), ["Pear"])
+
+    def test_index_follows_updates_and_deletes(self):
+        Product.objects.filter(pk=self.apple.pk).update(name="Banana")
+        self.pie.delete()
+        self.assertEqual(self.search("apple"), [])
+        self.assertEqual(self.search("banana"), ["Banana"])
+
+    def test_triggers_restored_after_migrate(self):
+        # Так триггер теряется при пересоздании таблицы в миграции SQLite
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER shopapp_product_fts_update")
+        Product.objects.filter(pk=self.apple.pk).update(name="Banana")
+        self.assertEqual(self.search("banana"), [])
+        emit_post_migrate_signal(verbosity=0, interactive=False, db="default")
+        self.assertEqual(self.search("banana"), ["Banana"])
+        Product.objects.filter(pk=self.apple.pk).update(name="Cherry")
+        self.assertEqual(self.search("cherry"), ["Cherry"])
+
+    def test_admin_search(self):
+        admin = User.objects.create_superuser("admin", password="admin")
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse("admin:shopapp_product_changelist"), {"q": "pear"}
+        )
+        self.assertContains(response, "Pear")
+        self.assertNotContains(response, "Apple pie")
+
+
+class ProductAutocompleteTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.apple = Product.objects.create(name="Apple", created_by=None)
+        Product.objects.bulk_create(
+            [
+                Product(name="Apple pie", created_by=None),
+                Product(name="Apricot", created_by=None),
+                Product(name="Éclair", created_by=None),
+                Product(name="Apple juice", archived=True, created_by=None),
+            ]
+        )
+
+    def setUp(self):
+        self.enterContext(translation.override("en"))
+        product_name_index.build()
+
+    def autocomplete(self, prefix: str, **params) -> list[str]:
+        response = self.client.get(
+            reverse("shopapp:product-autocomplete"),
+            {"q": prefix, **params},
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        return [product["name"] for product in response.json()["results"]]
+
+    def test_prefix_search(self):
+        self.assertEqual(self.autocomplete("ap"), ["Apple", "Apple pie", "Apricot"])
+        self.assertEqual(self.autocomplete("AP", limit=1), ["Apple"])
+        self.assertEqual(self.autocomplete("ecl"), ["Éclair"])
+        self.assertEqual(self.autocomplete(""), [])
+
+    def test_index_follows_product_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.apple.name = "Banana"
+            self.apple.save()
+            Product.objects.create(name="Apple tart", created_by=None)
+        self.assertEqual(self.autocomplete("appl"), ["Apple pie", "Apple tart"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.apple.archived = True
+            self.apple.save()
+        self.assertEqual(self.autocomplete("ban"), [])
+
+    def test_changes_during_rebuild_are_kept(self):
+        apple = self.apple
+
+        class RacingIndex(ProductNameIndex):
+            def make_key(self, name: str, pk: int) -> str:
+                if self.changes == {}:
+                    # Товар переименовали, пока индекс читал таблицу
+                    self.update(Product(pk=apple.pk, name="Banana"))
+                return super().make_key(name, pk)
+
+        index = RacingIndex()
+        index.build()
+        self.assertEqual(index.names[apple.pk], "Banana")
+        self.assertIn(ProductNameIndex.make_key("Banana", apple.pk), index.keys)
+        self.assertNotIn(ProductNameIndex.make_key("Apple", apple.pk), index.keys)
+        self.assertIsNone(index.changes)
+
+    def test_stats_report_memory(self):
+        admin = User.objects.create_superuser("admin", password="admin")
+        self.client.force_login(admin)
+        response = self.client.get(reverse("shopapp:product-autocomplete-stats"))
+        self.assertEqual(response.json()["size"], 4)
+        self.assertGreater(response.json()["memory_bytes"], 0)
+
+
+class OrderTotalsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="bob", password="qwerty")
+        cls.cheap = Product.objects.create(name="Cheap", price=10, created_by=None)
+        cls.dear = Product.objects.create(name="Dear", price=100, created_by=None)
+        cls.order = Order.objects.create(user=cls.user)
+
+    def assertTotals(self, order: Order, total: int, count: int):
+        order.refresh_from_db()
+        self.assertEqual((order.total_amount, order.products_count), (total, count))
+
+    def test_add_remove_and_clear(self):
+        self.order.products.add(self.cheap, self.dear)
+        self.assertTotals(self.order, 110, 2)
+        self.order.products.add(self.cheap)
+        self.order.products.remove(self.dear, Product(pk=self.dear.pk + 100))
+        self.assertTotals(self.order, 10, 1)
+        self.dear.orders.add(self.order)
+        self.assertTotals(self.order, 110, 2)
+        self.cheap.orders.clear()
+        self.assertTotals(self.order, 100, 1)
+        self.order.products.clear()
+        self.assertTotals(self.order, 0, 0)
+
+    def test_price_changes_and_product_delete(self):
+        self.order.products.set([self.cheap, self.dear])
+        self.cheap.price = "15.50"
+        self.cheap.save()
+        self.assertTotals(self.order, Decimal("115.50"), 2)
+        Product.objects.filter(pk=self.dear.pk).update(price=200)
+        self.assertTotals(self.order, Decimal("215.50"), 2)
+        self.cheap.delete()
+        self.assertTotals(self.order, 200, 1)
+
+    def test_price_upsert_with_bulk_create(self):
+        Product.objects.filter(pk=self.cheap.pk).update(sku="CHEAP")
+        self.order.products.set([self.cheap, self.dear])
+        Product.objects.bulk_create(
+            [
+                Product(name="Cheap", price=20, sku="CHEAP"),
+                Product(name="New", price=5, sku="NEW"),
+            ],
+            update_conflicts=True,
+            unique_fields=["sku"],
+            update_fields=["price"],
+        )
+        self.assertTotals(self.order, 120, 2)
+
+    def test_recompute_command_repairs_drift(self):
+        self.order.products.set([self.cheap, self.dear])
+        Order.objects.filter(pk=self.order.pk).update(total_amount=1, products_count=7)
+        call_command("recompute_order_totals", batch_size=1, stdout=StringIO())
+        self.assertTotals(self.order, 110, 2)
+
+    def test_set_products_bulk(self):
+        extra = Product.objects.create(name="Extra", price=1, created_by=None)
+        self.order.products.set([self.cheap, self.dear])
+        actions = []
+
+        def receiver(sender, action, pk_set, **kwargs):
+            actions.append((action, pk_set))
+
+        m2m_changed.connect(receiver, sender=Order.products.through)
+        self.addCleanup(m2m_changed.disconnect, receiver, Order.products.through)
+        with self.assertNumQueries(10):
+            result = self.order.set_products_bulk([self.dear.pk, extra], batch_size=1)
+        self.assertEqual(result, (1, 1))
+        self.assertEqual(
+            actions,
+            [
+                ("pre_remove", {self.cheap.pk}),
+                ("post_remove", {self.cheap.pk}),
+                ("pre_add", {extra.pk}),
+                ("post_add", {extra.pk}),
+            ],
+        )
+        self.assertQuerySetEqual(self.order.products.order_by("pk"), [self.dear, extra])
+        self.assertTotals(self.order, 101, 2)
+
+
+class DailyRollupsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="bob", password="qwerty")
+        cls.apple = Product.objects.create(name="Apple", price=10, created_by=None)
+        cls.pear = Product.objects.create(name="Pear", price=25, created_by=None)
+
+    def setUp(self):
+        self.enterContext(translation.override("en"))
+
+    def create_order(self, day: str, *products: Product) -> Order:
+        order = Order.objects.create(user=self.user)
+        order.products.set(products)
+        created_at = datetime.fromisoformat(f"{day}T12:00:00+00:00")
+        Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        return order
+
+    def test_refresh_is_incremental_and_idempotent(self):
+        self.create_order("2026-01-01", self.apple, self.pear)
+        self.create_order("2026-01-01", self.apple)
+        self.create_order("2026-01-02", self.pear)
+        refresh_rollups()
+        refresh_rollups()
+        self.assertEqual(
+            list(DailySales.objects.values_list("date", "orders_count", "units")),
+            [(date(2026, 1, 1), 2, 3), (date(2026, 1, 2), 1, 1)],
+        )
+        apple = DailyProductSales.objects.get(date="2026-01-01", product=self.apple)
+        self.assertEqual((apple.units, apple.revenue), (2, 20))
+
+        self.create_order("2026-01-02", self.apple)
+        self.create_order("2026-01-03", self.apple)
+        self.assertEqual(refresh_rollups()["since"], date(2026, 1, 2))
+        revenue = DailySales.objects.values_list("revenue", flat=True)
+        self.assertEqual(list(revenue), [45, 35, 10])
+
+    def test_api_filters_by_date(self):
+        self.create_order("2026-01-01", self.apple)
+        self.create_order("2026-01-05", self.pear)
+        call_command("refresh_rollups", stdout=StringIO())
+        admin = User.objects.create_superuser("admin", password="admin")
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse("shopapp:dailysales-list"),
+            {"date__gte": "2026-01-02"},
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(
+            response.json()["results"],
+            [{"date": "2026-01-05", "orders_count": 1, "units": 1, "revenue": "25.00"}],
+        )
+
+
+class ShopAnalyticsTestCase(TestCase):
+    def test_analytics(self):
+        user = User.objects.create_user(username="bob", password="qwerty")
+        other = User.objects.create_user(username="ann", password="qwerty")
+        cheap = Product.objects.create(name="Cheap", price=10, created_by=None)
+        dear = Product.objects.create(
+            name="Dear", price=100, discount=15, created_by=None
+        )
+        Order.objects.create(user=user).products.set([cheap, dear])
+        Order.objects.create(user=user).products.set([cheap])
+        Order.objects.create(user=other).products.set([cheap])
+        stdout = StringIO()
+        call_command("shop_analytics", chunk_size=2, stdout=stdout)
+        result = json.loads(stdout.getvalue())
+        self.assertEqual(result["order_lines"], 4)
+        self.assertEqual(result["order_revenue"]["total"], 130)
+        self.assertEqual(result["user_spend"]["count"], 2)
+        self.assertEqual(result["user_spend"]["p50"], 65)
+        bands = {band["band"]: band for band in result["discount_bands"]}
+        self.assertEqual(bands["0"]["units"], 3)
+        self.assertEqual(bands["10-19"]["revenue"], 100)
+        self.assertLess(result["price_elasticity"]["log_log_slope"], 0)
+
+
+class BenchCommandTestCase(TestCase):
+    def test_bench_and_compare(self):
+        with NamedTemporaryFile(suffix=".json") as baseline:
+            options = dict(
+                users=2, products=5, orders=5, repeat=2, warmup=0, only=["api_orders"]
+            )
+            call_command("bench", output=baseline.name, stdout=StringIO(), **options)
+            result = json.loads(baseline.read())["endpoints"]["api_orders"]
+            self.assertEqual(result["status"], 200)
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+
+            stdout = StringIO()
+            call_command(
+                "bench", compare=baseline.name, threshold=1000, stdout=stdout, **options
+            )
+            report = json.loads(stdout.getvalue())["compare"]["api_orders"]
+            self.assertEqual(report["queries_delta"], 0)
+            self.assertFalse(report["regression"])
+        self.assertFalse(User.objects.filter(username="bench-admin").exists())
+
+
+class GenerateShopDataTestCase(TestCase):
+    def generate(self, prefix: str) -> list:
+        call_command(
+            "generate_shop_data",
+            users=3,
+            products=20,
+            orders=30,
+            prefix=prefix,
+            seed=7,
+            chunk_size=8,
+            stdout=StringIO(),
+        )
+        return list(
+            Product.objects.filter(description__startswith="Generated")
+            .order_by("pk")
+            .values_list("price", "discount")
+        )
+
+    def test_generates_reproducible_data(self):
+        first = self.generate("first")
+        self.assertEqual(len(first), 20)
+        self.assertEqual(Order.objects.count(), 30)
+        order = Order.objects.order_by("pk").last()
+        self.assertEqual(order.products_count, order.products.count())
+        self.assertGreater(order.created_at, Order.objects.order_by("pk")[0].created_at)
+
+        Product.objects.all().delete()
+        self.assertEqual(self.generate("second"), first)
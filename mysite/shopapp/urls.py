@@ -17,6 +17,9 @@ from .views import (
     OrdersDataExportView,
     ProductViewSet,
     OrderViewSet,
+    JobViewSet,
+    DailySalesViewSet,
+    DailyProductSalesViewSet,
     LatestProductsFeed,
     UserOrdersListView,
     UserOrdersExportView,
@@ -27,6 +30,9 @@ app_name = "shopapp"
 routers = DefaultRouter()
 routers.register("products", ProductViewSet)
 routers.register("orders", OrderViewSet)
+routers.register("jobs", JobViewSet, basename="job")
+routers.register("rollups/daily-sales", DailySalesViewSet)
+routers.register("rollups/product-sales", DailyProductSalesViewSet)
 
 urlpatterns = [
     path("", ShopIndexView.as_view(), name="index"),
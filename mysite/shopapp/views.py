@@ -1,5 +1,7 @@
+import json
 from timeit import default_timer
 import logging
+from django.conf import settings
 from django.contrib.auth.decorators import permission_required
 from django.contrib.auth.mixins import (
     LoginRequiredMixin,
@@ -9,13 +11,19 @@ from django.contrib.auth.mixins import (
 from django.contrib.auth.models import Group, User
 from django.contrib.syndication.views import Feed
 from django.core.cache import cache
-from django.http import HttpResponse, HttpRequest, HttpResponseRedirect, JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import (
+    HttpResponse,
+    HttpRequest,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import render, redirect, reverse
 from django.urls import reverse_lazy
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.shortcuts import get_object_or_404
-from django.views.decorators.cache import cache_page
 from django.views.generic import (
     TemplateView,
     ListView,
@@ -24,27 +32,54 @@ from django.views.generic import (
     UpdateView,
     DeleteView,
 )
+from rest_framework import status
 from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.request import Request
 from rest_framework.response import Response
-
-from .common import save_csv_products
-from .models import Product, Order, ProductImage
+from rest_framework.reverse import reverse as api_reverse
+
+from .common import (
+    ORDER_EXPORT_FIELDS,
+    PRODUCT_EXPORT_FIELDS,
+    iter_orders_export,
+    stream_csv_rows,
+    stream_json_list,
+)
+from .cache import (
+    CATALOG_CACHE_TIMEOUT,
+    PRODUCTS,
+    USER_ORDERS_EXPORT_TIMEOUT,
+    CachedListMixin,
+    user_orders_export_key,
+    versioned_key,
+)
+from .jobs import enqueue_job
+from .models import Product, Order, ProductImage, Job, DailySales, DailyProductSales
+from .autocomplete import DEFAULT_LIMIT, MAX_LIMIT, product_name_index
+from .pagination import KeysetPagination
+from .search import ProductSearchFilter
 from .forms import GroupForm, ProductForm
-from rest_framework.viewsets import ModelViewSet
-from .serializers import ProductSerializer, OrderSerializer
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
+from .serializers import (
+    ProductSerializer,
+    OrderSerializer,
+    JobSerializer,
+    DailySalesSerializer,
+    DailyProductSalesSerializer,
+)
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
-from drf_spectacular.utils import extend_schema, OpenApiResponse
+from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiResponse
 from rest_framework.decorators import action
-from csv import DictWriter
 
 log = logging.getLogger(__name__)
 
 
 class OrderViewSet(ModelViewSet):
-    queryset = Order.objects.all()
+    queryset = Order.objects.order_by("created_at", "pk").prefetch_related("products")
     serializer_class = OrderSerializer
+    pagination_class = KeysetPagination
     filter_backends = [SearchFilter, DjangoFilterBackend, OrderingFilter]
     filterset_fields = [
         "delivery_address",
@@ -60,13 +95,12 @@ class OrderViewSet(ModelViewSet):
     ]
     ordering_fields = [
         "delivery_address",
-        "products",
         "user",
     ]
 
 
 @extend_schema(description="Product views CRUD")
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(CachedListMixin, ModelViewSet):
     """
     Набор представлений для действий над Product.
     Полный CRUD для сущностей товара.
@@ -74,8 +108,10 @@ class ProductViewSet(ModelViewSet):
 
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = KeysetPagination
+    list_cache_versions = (PRODUCTS,)
     filterset_fields = ["name", "description", "price", "discount", "archived"]
-    filter_backends = [SearchFilter, DjangoFilterBackend, OrderingFilter]
+    filter_backends = [ProductSearchFilter, DjangoFilterBackend, OrderingFilter]
     search_fields = ["name", "description"]
     ordering_fields = [
         "name",
@@ -92,33 +128,127 @@ class ProductViewSet(ModelViewSet):
         },
     )
     def retrieve(self, request, *args, **kwargs):
-        return super().retrieve(*args, **kwargs)
+        return super().retrieve(request, *args, **kwargs)
 
-    @method_decorator(cache_page(60 * 2))
-    def list(self, *args, **kwargs):
-        return super().list(*args, **kwargs)
+    @action(methods=["get"], detail=False, permission_classes=[IsAdminUser])
+    def cache_stats(self, request: Request):
+        return Response(self.get_list_cache_stats())
+
+    @extend_schema(
+        summary="Autocomplete product names",
+        parameters=[
+            OpenApiParameter("q", description="Name prefix"),
+            OpenApiParameter("limit", int, description=f"At most {MAX_LIMIT}"),
+        ],
+    )
+    @action(methods=["get"], detail=False)
+    def autocomplete(self, request: Request):
+        try:
+            limit = int(request.query_params.get("limit", DEFAULT_LIMIT))
+        except ValueError:
+            limit = DEFAULT_LIMIT
+        limit = max(1, min(limit, MAX_LIMIT))
+        prefix = request.query_params.get("q", "")
+        return Response({"results": product_name_index.search(prefix, limit)})
+
+    @action(methods=["get"], detail=False, permission_classes=[IsAdminUser])
+    def autocomplete_stats(self, request: Request):
+        return Response(product_name_index.stats())
 
     @action(methods=["get"], detail=False)
     def download_csv(self, request: Request):
-        response = HttpResponse(content_type="text/csv")
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.values_list(*PRODUCT_EXPORT_FIELDS).iterator(chunk_size=2000)
+        response = StreamingHttpResponse(
+            stream_csv_rows(PRODUCT_EXPORT_FIELDS, rows), content_type="text/csv"
+        )
         filename = "products-export.csv"
         response["Content-Disposition"] = f"attachment; filename={filename}"
-        queryset = self.filter_queryset(self.get_queryset())
-        fields = ["name", "description", "price", "discount"]
-        queryset = queryset.only(*fields)
-        writer = DictWriter(response, fieldnames=fields)
-        writer.writeheader()
-        for product in queryset:
-            writer.writerow({field: getattr(product, field) for field in fields})
         return response
 
-    @action(detail=False, methods=["post"], parser_classes=[MultiPartParser])
+    @action(detail=False, methods=["post"], permission_classes=[IsAuthenticated])
+    def export_csv(self, request: Request):
+        job = enqueue_job(
+            "export_products_csv",
+            user=request.user,
+            payload={"params": dict(request.query_params.lists())},
+        )
+        return job_accepted_response(request, job)
+
+    @action(
+        detail=False,
+        methods=["post"],
+        parser_classes=[MultiPartParser],
+        permission_classes=[IsAuthenticated],
+    )
     def upload_csv(self, request: Request):
-        products = save_csv_products(
-            request.FILES["file"].file, encoding=request.encoding
+        job = enqueue_job(
+            "import_products_csv",
+            user=request.user,
+            payload={
+                "encoding": request.encoding or settings.DEFAULT_CHARSET,
+                "upsert": request.query_params.get("mode") == "upsert",
+            },
+            file=request.FILES["file"],
         )
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        return job_accepted_response(request, job)
+
+
+def job_accepted_response(request: Request, job: Job) -> Response:
+    return Response(
+        {
+            "job": job.pk,
+            "status": job.status,
+            "status_url": api_reverse(
+                "shopapp:job-detail", kwargs={"pk": job.pk}, request=request
+            ),
+        },
+        status=status.HTTP_202_ACCEPTED,
+    )
+
+
+class JobViewSet(ReadOnlyModelViewSet):
+    """
+    Статус и результат фоновых задач для опроса клиентом.
+    """
+
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        if getattr(self, "swagger_fake_view", False):
+            # drf-spectacular строит схему без пользователя
+            return Job.objects.none()
+        queryset = Job.objects.all()
+        if self.request.user.is_staff:
+            return queryset
+        return queryset.filter(created_by=self.request.user)
+
+
+class DailySalesViewSet(ReadOnlyModelViewSet):
+    """
+    Дневная выручка из таблиц агрегатов (см. refresh_rollups).
+    """
+
+    queryset = DailySales.objects.order_by("date")
+    serializer_class = DailySalesSerializer
+    permission_classes = [IsAdminUser]
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {"date": ["exact", "gte", "lte"]}
+
+
+class DailyProductSalesViewSet(ReadOnlyModelViewSet):
+    """
+    Дневные продажи по товарам из таблиц агрегатов (см. refresh_rollups).
+    """
+
+    queryset = DailyProductSales.objects.order_by("date", "product_id")
+    serializer_class = DailyProductSalesSerializer
+    permission_classes = [IsAdminUser]
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {"date": ["exact", "gte", "lte"], "product": ["exact"]}
 
 
 class ShopIndexView(View):
@@ -134,7 +264,7 @@ class ShopIndexView(View):
             "products": products,
             "items": 5,
         }
-        print("shop index context", context)
+        log.debug("Shop index context: %s", context)
         log.debug("Products for shop index: %s", products)
         log.info("Rendering shop index")
         return render(request, "shopapp/shop-index.html", context=context)
@@ -273,6 +403,14 @@ class OrderUpdateView(UpdateView):
     fields = "delivery_address", "promocode", "user", "products"
     template_name_suffix = "_update_form"
 
+    def form_valid(self, form):
+        # Состав заказа пишем пачками вместо products.set() из save_m2m
+        self.object = form.save(commit=False)
+        self.object.save()
+        products = form.cleaned_data["products"]
+        self.object.set_products_bulk(products.values_list("pk", flat=True))
+        return HttpResponseRedirect(self.get_success_url())
+
     def get_success_url(self):
         return reverse(
             "shopapp:order_details",
@@ -286,8 +424,24 @@ class OrderDeleteView(DeleteView):
 
 
 class ProductsDataExportView(View):
-    def get(self, request: HttpRequest) -> JsonResponse:
-        cache_key = "products_data_export"
+    """
+    Выгрузка товаров в JSON.
+
+    ?format=ndjson - потоковая выгрузка, один товар на строку;
+    ?after=<pk>&limit=N - выгрузка по страницам, следующая страница
+    начинается после pk из поля "next".
+    """
+
+    fields = ("pk", "name", "price", "archived")
+    default_limit = 100
+    max_limit = 1000
+
+    def get(self, request: HttpRequest) -> HttpResponse:
+        if request.GET.get("format") == "ndjson":
+            return self.get_ndjson()
+        if "after" in request.GET or "limit" in request.GET:
+            return self.get_page(request)
+        cache_key = versioned_key("products_data_export", PRODUCTS)
         products_data = cache.get(cache_key)
         if products_data is None:
             products = Product.objects.order_by("pk").all()
@@ -300,28 +454,72 @@ class ProductsDataExportView(View):
                 }
                 for product in products
             ]
-            cache.set(cache_key, products_data, 300)
+            cache.set(cache_key, products_data, CATALOG_CACHE_TIMEOUT)
         return JsonResponse({"products": products_data})
 
+    def get_ndjson(self) -> StreamingHttpResponse:
+        rows = (
+            Product.objects.order_by("pk")
+            .values_list(*self.fields)
+            .iterator(chunk_size=2000)
+        )
+        lines = (
+            json.dumps(dict(zip(self.fields, row)), cls=DjangoJSONEncoder) + "\n"
+            for row in rows
+        )
+        return StreamingHttpResponse(lines, content_type="application/x-ndjson")
+
+    def get_page(self, request: HttpRequest) -> JsonResponse:
+        try:
+            after = int(request.GET.get("after", 0))
+            limit = int(request.GET.get("limit", self.default_limit))
+        except ValueError:
+            return JsonResponse(
+                {"error": "after and limit must be integers"}, status=400
+            )
+        limit = max(1, min(limit, self.max_limit))
+        products_data = list(
+            Product.objects.filter(pk__gt=after)
+            .order_by("pk")
+            .values(*self.fields)[:limit]
+        )
+        next_after = products_data[-1]["pk"] if len(products_data) == limit else None
+        return JsonResponse({"products": products_data, "next": next_after})
+
 
 class OrdersDataExportView(UserPassesTestMixin, View):
+    """
+    Потоковая выгрузка всех заказов в JSON или CSV (?format=csv).
+    Количество запросов к базе не зависит от количества заказов.
+    """
+
     def test_func(self):
         if self.request.user.is_staff:
             return True
 
-    def get(self, request: HttpRequest) -> JsonResponse:
-        orders = Order.objects.order_by("pk").all()
-        orders_data = [
-            {
-                "id": order.id,
-                "address": order.delivery_address,
-                "promocode": order.promocode,
-                "user": order.user,
-                "products": order.products,
-            }
-            for order in orders
-        ]
-        return JsonResponse({"orders": orders_data})
+    def get(self, request: HttpRequest) -> StreamingHttpResponse:
+        orders = iter_orders_export()
+        if request.GET.get("format") == "csv":
+            rows = (
+                [
+                    order["id"],
+                    order["address"],
+                    order["promocode"],
+                    order["user"],
+                    " ".join(map(str, order["products"])),
+                    order["products_count"],
+                    order["total_amount"],
+                ]
+                for order in orders
+            )
+            response = StreamingHttpResponse(
+                stream_csv_rows(ORDER_EXPORT_FIELDS, rows), content_type="text/csv"
+            )
+            response["Content-Disposition"] = "attachment; filename=orders-export.csv"
+            return response
+        return StreamingHttpResponse(
+            stream_json_list("orders", orders), content_type="application/json"
+        )
 
 
 class UserOrdersExportView(View):
@@ -331,28 +529,15 @@ class UserOrdersExportView(View):
         self.owner = get_object_or_404(User, id=pk)
         return self.owner
 
-    def get(self, request: HttpRequest) -> JsonResponse:
+    def get(self, request: HttpRequest, **kwargs) -> JsonResponse:
         self.get_object()
-        cache_key = "orders_data_export"
+        cache_key = user_orders_export_key(self.owner.pk)
         orders_data = cache.get(cache_key)
         if orders_data is None:
-            orders = (
-                Order.objects.select_related("user")
-                .filter(user=self.owner)
-                .order_by("pk")
-                .prefetch_related("products")
+            orders_data = list(
+                iter_orders_export(Order.objects.filter(user=self.owner))
             )
-            orders_data = [
-                {
-                    "id": order.id,
-                    "address": order.delivery_address,
-                    "promocode": order.promocode,
-                    "user": order.user,
-                    "products": order.products,
-                }
-                for order in orders
-            ]
-            cache.set(cache_key, orders_data, 300)
+            cache.set(cache_key, orders_data, USER_ORDERS_EXPORT_TIMEOUT)
         return JsonResponse({"orders": orders_data})
 
 